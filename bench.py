@@ -0,0 +1,485 @@
+# Micro-benchmarks for the py0dws kernel.
+#
+# usage: python3 bench.py lanes [lanes] [lane_length] [messages]
+#        python3 bench.py chain [length] [messages]
+#        python3 bench.py lazy [lanes] [lane_length]
+#        python3 bench.py instantiate [instances] [lane_length]
+#        python3 bench.py blocking [commands] [milliseconds] [nested]
+#        python3 bench.py async [leaves] [milliseconds]
+#        python3 bench.py process [leaves] [payload_kb]
+#        python3 bench.py coprocess [messages]
+#        python3 bench.py stream [megabytes]
+#        python3 bench.py writer [records]
+#        python3 bench.py backpressure [lines] [capacity]
+#        python3 bench.py datum [messages]
+#        python3 bench.py slices [payload_mb] [slices]
+#        python3 bench.py fanout [receivers] [payload_kb]
+#        python3 bench.py drawio [components] [tabs] [loose] [compressed]
+#
+# Networks are built in memory (no .drawio / das2json needed) by registering
+# container templates whose template_data has the same shape as the JSON that
+# das2json emits.
+
+import sys
+import os
+import re
+import zlib
+import base64
+import urllib.parse
+import time
+import asyncio
+import tempfile
+import tracemalloc
+
+import py0dws as zd
+import echo
+
+enumDown = 0
+enumAcross = 1
+enumUp = 2
+
+def endpoint (name, id):
+    return {"name": name, "id": id}
+
+def connection (dir, source, source_port, target, target_port):
+    return {"dir": dir, "source": source, "source_port": source_port, "target": target, "target_port": target_port}
+
+def chain_desc (name, length):
+    # self → Echo₁ → Echo₂ → ... → Echoₙ → self
+    children = [endpoint ("Echo", i + 1) for i in range (length)]
+    connections = [connection (enumDown, endpoint ("", 0), "", children [0], "")]
+    for i in range (length - 1):
+        connections.append (connection (enumAcross, children [i], "", children [i + 1], ""))
+    connections.append (connection (enumUp, children [-1], "", endpoint ("", 0), ""))
+    return {"file": "bench", "name": name, "children": children, "connections": connections}
+
+def lanes_desc (name, lane_name, lanes, wired=None):
+    # self fans out to `lanes` copies of `lane_name`, each of which feeds back up to self
+    # when `wired` is given, only the first `wired` lanes are fed from self's "" port, the rest hang off a "rare" port
+    children = [endpoint (lane_name, i + 1) for i in range (lanes)]
+    connections = []
+    for i in range (lanes):
+        child = children [i]
+        port = ""
+        if wired != None and i >= wired:
+            port = "rare"
+        connections.append (connection (enumDown, endpoint ("", 0), port, child, ""))
+        connections.append (connection (enumUp, child, "", endpoint ("", 0), ""))
+    return {"file": "bench", "name": name, "children": children, "connections": connections}
+
+def make_palette (descs):
+    reg = zd.make_component_registry ()
+    zd.generate_shell_components (reg, descs)
+    for desc in descs:
+        zd.register_component (reg, zd.Template (name=desc ["name"], template_data=desc, instantiator=zd.container_instantiator))
+    echo.install (reg)
+    zd.initialize_stock_components (reg)
+    return reg
+
+def bench_lanes (lanes, lane_length, messages):
+    # a network of lanes * (lane_length + 1) + 1 components
+    palette = make_palette ([chain_desc ("lane", lane_length), lanes_desc ("main", "lane", lanes)])
+    main_container = zd.get_component_instance (palette, "main", owner=None)
+    ncomponents = lanes * (lane_length + 1) + 1
+    start = time.perf_counter ()
+    for i in range (messages):
+        zd.inject (main_container, zd.make_message ("", zd.new_datum_string (f"m{i}")))
+    elapsed = time.perf_counter () - start
+    # every injected message visits every lane, and is delivered once per hop (down, across..., up)
+    delivered = messages * lanes * (lane_length + 2)
+    print (f"lanes: {ncomponents} components, {delivered} deliveries in {elapsed:.3f}s = {delivered / elapsed:,.0f} msgs/sec")
+
+def bench_chain (length, messages):
+    # regression check for the run queue: per-message cost must not grow with the number of messages already delivered
+    palette = make_palette ([chain_desc ("main", length)])
+    main_container = zd.get_component_instance (palette, "main", owner=None)
+    start = time.perf_counter ()
+    checkpoint = start
+    for i in range (messages):
+        zd.inject (main_container, zd.make_message ("", zd.new_datum_string (f"m{i}")))
+        if 0 == (i + 1) % (messages // 4):
+            now = time.perf_counter ()
+            print (f"chain: {i + 1} messages, last quarter {now - checkpoint:.3f}s, run queue length {len (main_container.visit_ordering)}")
+            checkpoint = now
+    elapsed = time.perf_counter () - start
+    delivered = messages * (length + 1)
+    print (f"chain: {length} components, {delivered} deliveries in {elapsed:.3f}s = {delivered / elapsed:,.0f} msgs/sec")
+
+def bench_lazy (lanes, lane_length):
+    # start-up plus one message, when only one of many sub-networks is used
+    palette = make_palette ([chain_desc ("lane", lane_length), lanes_desc ("main", "lane", lanes, wired=1)])
+    for lazy in [False, True]:
+        zd.lazy_containers = lazy
+        start = time.perf_counter ()
+        main_container = zd.get_component_instance (palette, "main", owner=None)
+        zd.inject (main_container, zd.make_message ("", zd.new_datum_string ("x")))
+        elapsed = time.perf_counter () - start
+        print (f"lazy={lazy}: {lanes} lanes of {lane_length}, instantiate + 1 message in {elapsed * 1000:.1f} ms")
+    zd.lazy_containers = False
+
+def bench_instantiate (instances, lane_length):
+    # eager instantiation of a container that reuses one sub-container template many times (best of 5)
+    palette = make_palette ([chain_desc ("lane", lane_length), lanes_desc ("main", "lane", instances)])
+    ncomponents = instances * (lane_length + 1) + 1
+    best = None
+    for i in range (5):
+        start = time.perf_counter ()
+        main_container = zd.get_component_instance (palette, "main", owner=None)
+        elapsed = time.perf_counter () - start
+        if best == None or elapsed < best:
+            best = elapsed
+        main_container = None
+    print (f"instantiate: {instances} instances of a {lane_length} component lane, {ncomponents} components in {best * 1000:.1f} ms = {ncomponents / best:,.0f} components/sec")
+
+def bench_blocking (commands, ms, nested=False):
+    # `commands` independent shell-outs of `sleep`, fed by one message - they should overlap, not run one after another
+    # when `nested`, each shell-out is wrapped in its own sub-container
+    sleep = f"$ sleep {ms / 1000}"
+    if nested:
+        descs = [lanes_desc ("job", sleep, 1), lanes_desc ("main", "job", commands)]
+    else:
+        descs = [lanes_desc ("main", sleep, commands)]
+    palette = make_palette (descs)
+    main_container = zd.get_component_instance (palette, "main", owner=None)
+    start = time.perf_counter ()
+    zd.inject (main_container, zd.make_message ("", zd.new_datum_string ("")))
+    elapsed = time.perf_counter () - start
+    print (f"blocking{' (nested)' if nested else ''}: {commands} x {ms} ms shell-outs, {len (main_container.outq)} results in {elapsed * 1000:.0f} ms (serial: {commands * ms} ms)")
+
+async def sleeper_handler (eh, msg):
+    await asyncio.sleep (eh.instance_data)
+    zd.send_string (eh, "", "slept", msg)
+
+def bench_async (leaves, ms):
+    # `leaves` coroutine leaves that each await asyncio.sleep, run by the asyncio kernel on an event loop
+    # that is shared with a heartbeat task - the heartbeat's worst delay shows whether the kernel hogs the loop
+    palette = make_palette ([lanes_desc ("main", "sleeper", leaves)])
+    zd.register_component (palette, zd.Template (name="sleeper", instantiator=lambda reg, owner, name, data: zd.make_blocking_leaf ("sleeper", owner, ms / 1000, sleeper_handler)))
+    main_container = zd.get_component_instance (palette, "main", owner=None)
+    async def heartbeat (worst):
+        while True:
+            before = time.perf_counter ()
+            await asyncio.sleep (0.001)
+            worst [0] = max (worst [0], time.perf_counter () - before - 0.001)
+    async def run ():
+        worst = [0]
+        beat = asyncio.create_task (heartbeat (worst))
+        start = time.perf_counter ()
+        await zd.inject_async (main_container, zd.make_message ("", zd.new_datum_string ("")))
+        elapsed = time.perf_counter () - start
+        beat.cancel ()
+        return [elapsed, worst [0]]
+    cpu = time.process_time ()
+    [elapsed, worst] = asyncio.run (run ())
+    cpu = time.process_time () - cpu
+    print (f"async: {leaves} x {ms} ms coroutine leaves, {len (main_container.outq)} results in {elapsed * 1000:.0f} ms, {cpu * 1000:.0f} ms CPU, worst event loop delay {worst * 1000:.1f} ms")
+
+def checksum_handler (eh, msg):
+    # a CPU-bound, pure Python transform
+    h = 0
+    for b in msg.datum.raw ():
+        h = (h * 31 + b) & 0xffffffff
+    zd.send_string (eh, "", f"{h:08x}" * (len (msg.datum.data) // 8), msg)
+
+def bench_process (leaves, payload_kb):
+    # `leaves` independent CPU-bound transforms of one payload, run inline and then in the process pool
+    # (the process pool's start-up is not timed, the first run only warms it up)
+    payload = zd.new_datum_string ("x" * (payload_kb * 1024))
+    for make in [zd.make_leaf, zd.make_process_leaf, zd.make_process_leaf]:
+        palette = make_palette ([lanes_desc ("main", "checksum", leaves)])
+        zd.register_component (palette, zd.Template (name="checksum", instantiator=lambda reg, owner, name, data: make ("checksum", owner, None, checksum_handler)))
+        main_container = zd.get_component_instance (palette, "main", owner=None)
+        start = time.perf_counter ()
+        zd.inject (main_container, zd.make_message ("", payload))
+        elapsed = time.perf_counter () - start
+        where = "process pool" if make == zd.make_process_leaf else "inline"
+        print (f"process: {leaves} x {payload_kb} KB checksums {where} ({zd.process_pool_size} workers), {len (main_container.outq)} results in {elapsed * 1000:.0f} ms")
+
+def bench_coprocess (messages):
+    # lines streamed one message at a time through sed, started per message ("$") and kept running ("$$")
+    for name in ["$ sed -u s/a/b/", "$$ sed -u s/a/b/"]:
+        palette = make_palette ([lanes_desc ("main", name, 1)])
+        main_container = zd.get_component_instance (palette, "main", owner=None)
+        start = time.perf_counter ()
+        for i in range (messages):
+            zd.inject (main_container, zd.make_message ("", zd.new_datum_string (f"line {i} aaa")))
+        elapsed = time.perf_counter () - start
+        print (f"coprocess: {messages} lines through \"{name}\" in {elapsed * 1000:.0f} ms = {messages / elapsed:,.0f} lines/sec")
+
+class Counter_Data:
+    def __init__ (self):
+        self.pieces = 0
+        self.size = 0
+        self.first = None
+
+def counter_handler (eh, msg):
+    inst = eh.instance_data
+    if inst.first == None:
+        inst.first = time.perf_counter ()
+    inst.pieces += 1
+    inst.size += len (msg.datum.data)
+
+def bench_stream (megabytes):
+    # a file read whole, in chunks (also from inside a sub-container), and in lines, into a component that
+    # counts what it gets: when the first piece arrives, and the most memory held at once (under tracemalloc)
+    fname = os.path.join (tempfile.mkdtemp (), "stream.txt")
+    with open (fname, "w") as f:
+        line = "x" * 99 + "\n"
+        for i in range (megabytes * 10486):
+            f.write (line)
+    for [reader, nested] in [["Low Level Read Text File", False], ["Read File Chunks", False], ["Read File Chunks", True], ["Read File Lines", False]]:
+        descs = []
+        source = reader
+        if nested:
+            source = "wrapped"
+            descs.append ({"file": "bench", "name": source, "children": [endpoint (reader, 1)],
+                           "connections": [connection (enumDown, endpoint ("", 0), "", endpoint (reader, 1), ""),
+                                           connection (enumUp, endpoint (reader, 1), "", endpoint ("", 0), ""),
+                                           connection (enumUp, endpoint (reader, 1), "eof", endpoint ("", 0), "eof")]})
+        descs.append ({"file": "bench", "name": "main", "children": [endpoint (source, 1), endpoint ("counter", 2)],
+                       "connections": [connection (enumDown, endpoint ("", 0), "", endpoint (source, 1), ""),
+                                       connection (enumAcross, endpoint (source, 1), "", endpoint ("counter", 2), ""),
+                                       connection (enumUp, endpoint (source, 1), "eof", endpoint ("", 0), "eof")]})
+        palette = make_palette (descs)
+        counter = Counter_Data ()
+        zd.register_component (palette, zd.Template (name="counter", instantiator=lambda reg, owner, name, data: zd.make_leaf ("counter", owner, counter, counter_handler)))
+        main_container = zd.get_component_instance (palette, "main", owner=None)
+        tracemalloc.start ()
+        start = time.perf_counter ()
+        zd.inject (main_container, zd.make_message ("", zd.new_datum_string (fname)))
+        elapsed = time.perf_counter () - start
+        peak = tracemalloc.get_traced_memory () [1]
+        tracemalloc.stop ()
+        where = " in a sub-container" if nested else ""
+        print (f"stream: {megabytes} MB with \"{reader}\"{where}: {counter.pieces} pieces, first after {(counter.first - start) * 1000:.1f} ms, all in {elapsed * 1000:.0f} ms, peak {peak / (1 << 20):.1f} MB")
+    os.remove (fname)
+
+def bench_writer (records):
+    # short records appended to a log file - by syncfilewrite (open, write and close per record, given the
+    # filename each time, as it overwrites), and by Buffered File Writer unbatched and batched
+    fname = os.path.join (tempfile.mkdtemp (), "log.txt")
+    for [writer, flush_count] in [["syncfilewrite", 1], ["Buffered File Writer", 1], ["Buffered File Writer", zd.file_writer_flush_count]]:
+        desc = {"file": "bench", "name": "main", "children": [endpoint (writer, 1)],
+                "connections": [connection (enumDown, endpoint ("", 0), "filename", endpoint (writer, 1), "filename"),
+                                connection (enumDown, endpoint ("", 0), "", endpoint (writer, 1), "input"),
+                                connection (enumDown, endpoint ("", 0), "close", endpoint (writer, 1), "close"),
+                                connection (enumUp, endpoint (writer, 1), "done", endpoint ("", 0), "done"),
+                                connection (enumUp, endpoint (writer, 1), "✗", endpoint ("", 0), "✗")]}
+        main_container = zd.get_component_instance (make_palette ([desc]), "main", owner=None)
+        saved = zd.file_writer_flush_count
+        zd.file_writer_flush_count = flush_count
+        start = time.perf_counter ()
+        zd.inject (main_container, zd.make_message ("filename", zd.new_datum_string (fname)))
+        for i in range (records):
+            if writer == "syncfilewrite":
+                zd.inject (main_container, zd.make_message ("filename", zd.new_datum_string (fname)))
+            zd.inject (main_container, zd.make_message ("", zd.new_datum_string (f"record {i}\n")))
+        if writer != "syncfilewrite":
+            zd.inject (main_container, zd.make_message ("close", zd.new_datum_bang ()))
+        elapsed = time.perf_counter () - start
+        zd.file_writer_flush_count = saved
+        errors = [m.datum.srepr () for m in main_container.outq if m.port == "✗"]
+        print (f"writer: {records} records with {writer} (flush every {flush_count}) in {elapsed * 1000:.0f} ms = {records / elapsed:,.0f} records/sec {errors if errors else ''}")
+    os.remove (fname)
+
+def bench_backpressure (nlines, capacity):
+    # a file streamed a line at a time into a slower co-process, whose replies are counted, with every input queue
+    # unbounded and bounded (default_inq_capacity), with both directly in the top-level container, and with the
+    # reader or the co-process inside a sub-container: the longest any queue got, and the most memory held at once
+    # (under tracemalloc)
+    fname = os.path.join (tempfile.mkdtemp (), "lines.txt")
+    with open (fname, "w") as f:
+        for i in range (nlines):
+            f.write (f"line {i} " + "x" * 2000 + "\n")
+    reader = "Read File Lines"
+    consumer = "$$ cat"
+    saved = zd.default_inq_capacity
+    for nested in [None, reader, consumer]:
+        for bound in [None, capacity]:
+            descs = []
+            source = reader
+            sink = consumer
+            if nested == reader:
+                source = "wrapped"
+                descs.append ({"file": "bench", "name": source, "children": [endpoint (reader, 1)],
+                               "connections": [connection (enumDown, endpoint ("", 0), "", endpoint (reader, 1), ""),
+                                               connection (enumUp, endpoint (reader, 1), "", endpoint ("", 0), ""),
+                                               connection (enumUp, endpoint (reader, 1), "eof", endpoint ("", 0), "eof")]})
+            elif nested == consumer:
+                sink = "wrapped"
+                descs.append ({"file": "bench", "name": sink, "children": [endpoint (consumer, 1)],
+                               "connections": [connection (enumDown, endpoint ("", 0), "", endpoint (consumer, 1), ""),
+                                               connection (enumUp, endpoint (consumer, 1), "", endpoint ("", 0), ""),
+                                               connection (enumUp, endpoint (consumer, 1), "✗", endpoint ("", 0), "✗")]})
+            descs.append ({"file": "bench", "name": "main", "children": [endpoint (source, 1), endpoint (sink, 2), endpoint ("counter", 3)],
+                           "connections": [connection (enumDown, endpoint ("", 0), "", endpoint (source, 1), ""),
+                                           connection (enumAcross, endpoint (source, 1), "", endpoint (sink, 2), ""),
+                                           connection (enumUp, endpoint (source, 1), "eof", endpoint ("", 0), "eof"),
+                                           connection (enumAcross, endpoint (sink, 2), "", endpoint ("counter", 3), ""),
+                                           connection (enumUp, endpoint (sink, 2), "✗", endpoint ("", 0), "✗")]})
+            palette = make_palette (descs)
+            counter = Counter_Data ()
+            zd.register_component (palette, zd.Template (name="counter", instantiator=lambda reg, owner, name, data: zd.make_leaf ("counter", owner, counter, counter_handler)))
+            zd.default_inq_capacity = bound
+            zd.reset_run_state ()
+            main_container = zd.get_component_instance (palette, "main", owner=None)
+            tracemalloc.start ()
+            start = time.perf_counter ()
+            zd.inject (main_container, zd.make_message ("", zd.new_datum_string (fname)))
+            elapsed = time.perf_counter () - start
+            peak = tracemalloc.get_traced_memory () [1]
+            tracemalloc.stop ()
+            longest = max ([s [3] for s in zd.queue_statistics (main_container) if s [0] != main_container.name])
+            where = f", \"{nested}\" in a sub-container" if nested != None else ""
+            print (f"backpressure: {nlines} lines from \"{reader}\" into \"{consumer}\"{where}, capacity {bound}: {counter.pieces} results in {elapsed * 1000:.0f} ms, longest queue {longest}, peak {peak / (1 << 20):.1f} MB")
+            main_container = None
+    zd.default_inq_capacity = saved
+    zd.reset_run_state ()
+    os.remove (fname)
+
+def bench_datum (messages):
+    # memory held by, and time to create, messages carrying string and bang datums (each cloned once, as `send` does)
+    tracemalloc.start ()
+    before = tracemalloc.get_traced_memory () [0]
+    start = time.perf_counter ()
+    held = []
+    for i in range (messages):
+        held.append (zd.make_message ("", zd.new_datum_string ("x")))
+        held.append (zd.make_message ("", zd.new_datum_bang ()))
+    elapsed = time.perf_counter () - start
+    after = tracemalloc.get_traced_memory () [0]
+    tracemalloc.stop ()
+    n = 2 * messages
+    print (f"datum: {n} messages, {(after - before) / n:.0f} bytes/message, {n / elapsed:,.0f} messages/sec (under tracemalloc)")
+
+def bench_slices (payload_mb, nslices):
+    # a large bytes payload cut into pieces, by copying the pieces out (as before) and with Datum_Bytes.slice
+    datum = zd.new_datum_bytes (os.urandom (payload_mb << 20))
+    size = len (datum.raw ()) // nslices
+    for how in ["copied", "sliced"]:
+        tracemalloc.start ()
+        start = time.perf_counter ()
+        if how == "copied":
+            pieces = [zd.new_datum_bytes (datum.raw () [i * size:(i + 1) * size]) for i in range (nslices)]
+        else:
+            pieces = [datum.slice (i * size, (i + 1) * size) for i in range (nslices)]
+        elapsed = time.perf_counter () - start
+        held = tracemalloc.get_traced_memory () [0]
+        tracemalloc.stop ()
+        pieces = None
+        print (f"slices: {payload_mb} MB into {nslices} pieces {how} in {elapsed * 1000:.1f} ms, holding {held / (1 << 20):.1f} MB")
+
+def bench_fanout (receivers, payload_kb):
+    # memory retained after fanning one large bytes payload out to many receivers
+    palette = make_palette ([lanes_desc ("main", "trash", receivers)])
+    main_container = zd.get_component_instance (palette, "main", owner=None)
+    payload = bytearray (payload_kb * 1024)
+    tracemalloc.start ()
+    before = tracemalloc.get_traced_memory () [0]
+    zd.inject (main_container, zd.make_message ("", zd.new_datum_bytes (payload)))
+    after = tracemalloc.get_traced_memory () [0]
+    tracemalloc.stop ()
+    print (f"fanout: {payload_kb} KB payload to {receivers} receivers retains {(after - before) / 1024:,.0f} KB")
+
+def drawio_tab (name, ncomponents, loose=False):
+    # a draw.io tab holding a chain of Echo components, each with an input and an output port (4 cells per component)
+    # when `loose`, ports are not child cells of their components, and arrows are not glued to ports,
+    # so that the transpiler has to work out containment and attachment from geometry
+    cells = ['<mxCell id="0" />', '<mxCell id="1" parent="0" />',
+             '<mxCell id="in" value="" style="rhombus;html=1;" parent="1" vertex="1"><mxGeometry x="0" y="0" width="40" height="40" as="geometry" /></mxCell>',
+             '<mxCell id="out" value="" style="rhombus;html=1;" parent="1" vertex="1"><mxGeometry x="0" y="80" width="40" height="40" as="geometry" /></mxCell>']
+    source = ["in", 20, 20]
+    for i in range (ncomponents):
+        x = 100 + (i % 100) * 200
+        y = 100 + (i // 100) * 150
+        cells.append (f'<mxCell id="c{i}" value="Echo" style="rounded=1;container=1;html=1;" parent="1" vertex="1"><mxGeometry x="{x}" y="{y}" width="120" height="100" as="geometry" /></mxCell>')
+        if loose:
+            cells.append (f'<mxCell id="c{i}i" value="" style="rounded=1;arcSize=50;html=1;" parent="1" vertex="1"><mxGeometry x="{x - 16}" y="{y + 27}" width="36" height="25" as="geometry" /></mxCell>')
+            cells.append (f'<mxCell id="c{i}o" value="" style="rounded=1;arcSize=50;html=1;" parent="1" vertex="1"><mxGeometry x="{x + 100}" y="{y + 27}" width="36" height="25" as="geometry" /></mxCell>')
+        else:
+            cells.append (f'<mxCell id="c{i}i" value="" style="rounded=1;arcSize=50;html=1;" parent="c{i}" vertex="1"><mxGeometry x="-16" y="27" width="36" height="25" as="geometry" /></mxCell>')
+            cells.append (f'<mxCell id="c{i}o" value="" style="rounded=1;arcSize=50;html=1;" parent="c{i}" vertex="1"><mxGeometry x="100" y="27" width="36" height="25" as="geometry" /></mxCell>')
+        cells.append (drawio_edge (f"e{i}", source, [f"c{i}i", x + 2, y + 39], loose))
+        source = [f"c{i}o", x + 118, y + 39]
+    cells.append (drawio_edge ("eout", source, ["out", 20, 100], loose))
+    body = "\n        ".join (cells)
+    return f'  <diagram name="{name}" id="{name}">\n    <mxGraphModel>\n      <root>\n        {body}\n      </root>\n    </mxGraphModel>\n  </diagram>\n'
+
+def drawio_edge (id, source, target, loose):
+    # `source` and `target` are [cell id, x, y]
+    if loose:
+        return f'<mxCell id="{id}" style="edgeStyle=orthogonalEdgeStyle;html=1;" parent="1" edge="1"><mxGeometry relative="1" as="geometry"><mxPoint x="{source [1]}" y="{source [2]}" as="sourcePoint" /><mxPoint x="{target [1]}" y="{target [2]}" as="targetPoint" /></mxGeometry></mxCell>'
+    else:
+        return f'<mxCell id="{id}" style="edgeStyle=orthogonalEdgeStyle;html=1;" parent="1" source="{source [0]}" target="{target [0]}" edge="1"><mxGeometry relative="1" as="geometry" /></mxCell>'
+
+def compress_tab (tab):
+    # stores the tab's <mxGraphModel> the way draw.io does when compression is on
+    m = re.search (r'<mxGraphModel>.*</mxGraphModel>', tab, re.DOTALL)
+    deflater = zlib.compressobj (9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    escaped = urllib.parse.quote (m.group (0), safe="-_.!~*'()").encode ('ascii')
+    blob = base64.b64encode (deflater.compress (escaped) + deflater.flush ()).decode ('ascii')
+    return tab [:m.start ()] + blob + tab [m.end ():]
+
+def write_drawio (fname, tabs):
+    with open (fname, "w") as f:
+        f.write ('<mxfile host="bench">\n')
+        for tab in tabs:
+            f.write (tab)
+        f.write ('</mxfile>\n')
+
+def bench_drawio (ncomponents, ntabs, loose=False, compressed=False):
+    import drawio2json
+    fname = os.path.join (tempfile.mkdtemp (), "bench.drawio")
+    tabs = [drawio_tab (f"tab{t}", ncomponents, loose) for t in range (ntabs)]
+    if compressed:
+        tabs = [compress_tab (tab) for tab in tabs]
+    write_drawio (fname, tabs)
+    ncells = ntabs * (4 * ncomponents + 5)
+    start = time.perf_counter ()
+    containers = drawio2json.transpile (fname)
+    elapsed = time.perf_counter () - start
+    # again from scratch under tracemalloc, which would slow the timed run down
+    drawio2json.transpiled_tabs.clear ()
+    drawio2json.decoded_tabs.clear ()
+    tracemalloc.start ()
+    drawio2json.transpile (fname)
+    peak = tracemalloc.get_traced_memory () [1]
+    tracemalloc.stop ()
+    print (f"drawio{' (loose)' if loose else ''}{' (compressed)' if compressed else ''}: {ntabs} tabs, {ncells} cells ({os.path.getsize (fname) // 1024} KB) transpiled in {elapsed * 1000:.1f} ms = {ncells / elapsed:,.0f} cells/sec, peak {peak / (1 << 20):.1f} MB")
+    return containers
+
+def arg (n, default):
+    return int (sys.argv [n]) if len (sys.argv) > n else default
+
+if __name__ == "__main__":
+    which = sys.argv [1] if len (sys.argv) > 1 else "lanes"
+    if which == "drawio":
+        bench_drawio (arg (2, 2500), arg (3, 1), "loose" in sys.argv, "compressed" in sys.argv)
+    elif which == "fanout":
+        bench_fanout (arg (2, 10), arg (3, 1024))
+    elif which == "blocking":
+        bench_blocking (arg (2, 8), arg (3, 200), "nested" in sys.argv)
+    elif which == "async":
+        bench_async (arg (2, 100), arg (3, 200))
+    elif which == "process":
+        bench_process (arg (2, 32), arg (3, 1024))
+    elif which == "coprocess":
+        bench_coprocess (arg (2, 1000))
+    elif which == "stream":
+        bench_stream (arg (2, 64))
+    elif which == "slices":
+        bench_slices (arg (2, 64), arg (3, 1024))
+    elif which == "writer":
+        bench_writer (arg (2, 20000))
+    elif which == "backpressure":
+        bench_backpressure (arg (2, 20000), arg (3, 16))
+    elif which == "datum":
+        bench_datum (arg (2, 100000))
+    elif which == "lazy":
+        bench_lazy (arg (2, 500), arg (3, 20))
+    elif which == "instantiate":
+        bench_instantiate (arg (2, 500), arg (3, 20))
+    elif which == "chain":
+        bench_chain (arg (2, 2), arg (3, 100000))
+    else:
+        bench_lanes (arg (2, 100), arg (3, 20), arg (4, 20))
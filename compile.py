@@ -1,5 +1,11 @@
 import subprocess
+import os
 import output
+import diagram_cache
+import drawio2json
+
+# diagrams are transpiled in-process by drawio2json.py, set this to use the das2json binary (MacOS only) instead
+use_das2json = False
 
 def transpileDiagram (fname):
     ret = subprocess.run (['./das2json/mac/das2json', f'{fname}'], capture_output=True, encoding='utf-8')
@@ -8,10 +14,46 @@ def transpileDiagram (fname):
             output.append ("error", ret.stderr)
         else:
             output.append ("error", f"error in shell_out {ret.returncode}")
+        return False
     else:
-        return output.append ("output", ret.stdout)
+        output.append ("output", ret.stdout)
+        return True
+
+# das2json writes the transpiled diagram next to the diagram, as <diagram>.json
+def json_filename (fname):
+    return f'{fname}.json'
+
+def transpile_and_read (fname, data):
+    print (f'transpiling diagram {fname}')
+    if use_das2json:
+        if transpileDiagram (fname):
+            return diagram_cache.read_bytes (json_filename (fname))
+        else:
+            return None
+    else:
+        containers = drawio2json.transpile (fname, data)
+        if containers != None:
+            return drawio2json.json_text (containers).encode ('utf-8')
+        else:
+            return None
+
+transpiled = diagram_cache.Content_Cache (transpile_and_read)
+on_disk = {} # diagram filename -> transpiled JSON currently in <diagram>.json
 
 def compile (filename):
-    print (f'transpiling diagram {filename}')
-    return transpileDiagram (filename)
-    
+    # returns None on success, or the output buffers (containing "error") on failure
+    output.reset ()
+    try:
+        json_text = transpiled.get (filename)
+    except OSError as e:
+        # e.g. no filename yet, or the diagram was moved away - the cache reads the file before transpiling it
+        output.append ("error", f"{filename}: {e}")
+        return output.get ()
+    if json_text == None:
+        return output.get ()
+    jsonfname = json_filename (filename)
+    if (on_disk.get (filename) is not json_text) or (not os.path.exists (jsonfname)):
+        with open (jsonfname, 'wb') as f:
+            f.write (json_text)
+        on_disk [filename] = json_text
+    return None
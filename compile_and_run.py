@@ -1,11 +1,44 @@
 import compile
 import run
+
+# filename -> [transpiled diagram, input text, result] of the last successful run
+last_run = {}
     
-def compile_and_run (filename, input_text):
+# `on_save` is set when the run is triggered by the file watcher - a save that changes nothing reuses
+# the last result, whereas a run that the user asks for always runs the diagram again
+def compile_and_run (filename, input_text, on_save=False):
+    [r, transpiled] = compile_or_reuse (filename, input_text, on_save)
+    if r == None:
+        r = remember_run (filename, transpiled, input_text, run.run (filename, input_text))
+    return r
+
+# the same, for callers on an event loop (the REPL) - the run doesn't block the loop
+# compiling writes to output's globals too, so the compile and the run are done together, under the run lock
+async def compile_and_run_async (filename, input_text, on_save=False):
+    async with run.get_run_lock ():
+        [r, transpiled] = compile_or_reuse (filename, input_text, on_save)
+        if r == None:
+            r = remember_run (filename, transpiled, input_text, await run.run_async_locked (filename, input_text))
+        return r
+
+# returns [result, transpiled diagram], where result is None if the diagram needs to be run
+def compile_or_reuse (filename, input_text, on_save):
     r = compile.compile (filename)
     print (f'compile --> {r}')
     if r != None and "error" in r:
         print (f'  {"error" in r}')
+        return [r, None]
+    # a save that changes nothing (or only the layout) gives the same diagram, and the same result
+    transpiled = compile.on_disk.get (filename)
+    previous = last_run.get (filename)
+    if on_save and previous != None and previous [0] == transpiled and previous [1] == input_text:
+        print ('diagram and input unchanged, not re-running')
+        return [previous [2], transpiled]
+    return [None, transpiled]
+
+def remember_run (filename, transpiled, input_text, r):
+    if not ("error" in r):
+        last_run [filename] = [transpiled, input_text, r]
     else:
-        r = run.run (filename, input_text)
+        last_run.pop (filename, None)
     return r
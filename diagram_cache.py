@@ -0,0 +1,51 @@
+import os
+import hashlib
+import collections
+
+# Caches an artifact built from a file (transpiled JSON, a component palette, ...) under the
+# hash of the file's contents, so that the artifact is rebuilt only when the contents change.
+#
+# The file is re-read and re-hashed only when its (mtime, size) changes - draw.io rewrites the
+# file on every save, so a save that changes nothing costs one read and one hash, and is then
+# served from the cache. Going back to earlier contents (e.g. undo) is also a hit, for up to
+# `max_entries` distinct contents.
+#
+# `build (filename, data)` returns the artifact for the given file contents (bytes), or None
+# if it could not be built - failures are not cached.
+
+def content_hash (data):
+    return hashlib.sha256 (data).hexdigest ()
+
+def read_bytes (filename):
+    with open (filename, 'rb') as f:
+        return f.read ()
+
+class Content_Cache:
+    def __init__ (self, build, max_entries=8):
+        self.build = build
+        self.max_entries = max_entries
+        self.signatures = {} # filename -> [(mtime, size), content hash]
+        self.artifacts = collections.OrderedDict () # content hash -> artifact, least recently used first
+
+    def get (self, filename):
+        st = os.stat (filename)
+        signature = (st.st_mtime_ns, st.st_size)
+        data = None
+        known = self.signatures.get (filename)
+        if known != None and known [0] == signature:
+            h = known [1]
+        else:
+            data = read_bytes (filename)
+            h = content_hash (data)
+            self.signatures [filename] = [signature, h]
+        if h in self.artifacts:
+            self.artifacts.move_to_end (h)
+            return self.artifacts [h]
+        if data == None:
+            data = read_bytes (filename)
+        artifact = self.build (filename, data)
+        if artifact != None:
+            self.artifacts [h] = artifact
+            while len (self.artifacts) > self.max_entries:
+                self.artifacts.popitem (last=False)
+        return artifact
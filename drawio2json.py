@@ -0,0 +1,490 @@
+# Transpiles a draw.io diagram into the JSON that py0dws.container_instantiator consumes -
+# a Python replacement for das2json (https://github.com/guitarvydas/0D/tree/main/das2json).
+#
+# usage: python3 drawio2json.py <diagram.drawio>     (writes <diagram.drawio>.json)
+#
+# Each tab (<diagram>) becomes one container:
+#   {"file": ..., "name": <tab name>, "children": [{"name": ..., "id": ...}, ...], "connections": [...]}
+#
+# Conventions, as drawn in 0D diagrams:
+#   - a rectangle on the diagram is a child component, named by its label
+#   - a shape placed inside a component is one of its ports, named by its label - either a child cell
+#     of the component in draw.io, or a shape whose centre lies within the component's rectangle
+#   - a rhombus (or ellipse) on the diagram is a port of the container itself ("self")
+#   - an arrow connects a source port to a target port; an arrow that ends on a component
+#     instead of one of its ports uses the port named ""; an arrow that is not glued to a shape
+#     is attached to the smallest shape under its end point
+#   - text cells are comments, and are ignored
+#
+# Tabs may be saved compressed or uncompressed.
+#
+# The file is read with a streaming parser (iterparse): only a small record is kept per cell,
+# and each cell's XML is discarded as soon as the cell has been read (see Cell_Reader). Tabs are transpiled
+# incrementally - each tab's XML is hashed, and only tabs whose XML changed since the last
+# transpile of the same file are parsed again (see `transpile`). Geometric questions
+# (which shape contains this port / this arrow end) go through a grid index (Grid_Index),
+# so they cost about the same for a diagram of 100 shapes as for one of 100,000.
+
+import sys
+import io
+import re
+import json
+import html
+import hashlib
+import base64
+import zlib
+import urllib.parse
+import collections
+import xml.etree.ElementTree as ET
+
+import output
+
+enumDown = 0
+enumAcross = 1
+enumUp = 2
+enumThrough = 3
+
+class Cell:
+    def __init__ (self):
+        self.id = None
+        self.value = ""
+        self.style = ""
+        self.parent = None
+        self.vertex = False
+        self.edge = False
+        self.source = None
+        self.target = None
+        self.x = 0.0
+        self.y = 0.0
+        self.width = 0.0
+        self.height = 0.0
+        self.source_point = None # [x, y] of an arrow end that is not glued to a shape
+        self.target_point = None
+
+def style_shape (style):
+    # the first style entry names the shape when it has no "=", e.g. "rhombus;whiteSpace=wrap;..."
+    first = style.split (";") [0]
+    if "=" in first:
+        return ""
+    else:
+        return first
+
+def is_gate (cell):
+    shape = style_shape (cell.style)
+    return shape == "rhombus" or shape == "ellipse"
+
+def is_comment (cell):
+    return style_shape (cell.style) == "text"
+
+def label (value, style):
+    if value == None:
+        return ""
+    elif "html=1" in style:
+        s = re.sub (r'<br\s*/?>', '\n', value)
+        s = re.sub (r'<[^>]*>', '', s)
+        return html.unescape (s)
+    else:
+        return value
+
+def number (s):
+    if s == None:
+        return 0.0
+    else:
+        return float (s)
+
+def make_cell (elem, wrapper=None):
+    cell = Cell ()
+    cell.id = elem.get ("id")
+    cell.style = elem.get ("style") or ""
+    cell.value = label (elem.get ("value"), cell.style)
+    if wrapper != None:
+        # <UserObject label="..." id="..."><mxCell .../></UserObject>
+        cell.id = wrapper.get ("id")
+        cell.value = label (wrapper.get ("label"), cell.style)
+    cell.parent = elem.get ("parent")
+    cell.vertex = ("1" == elem.get ("vertex"))
+    cell.edge = ("1" == elem.get ("edge"))
+    cell.source = elem.get ("source")
+    cell.target = elem.get ("target")
+    geometry = elem.find ("mxGeometry")
+    if geometry != None:
+        cell.x = number (geometry.get ("x"))
+        cell.y = number (geometry.get ("y"))
+        cell.width = number (geometry.get ("width"))
+        cell.height = number (geometry.get ("height"))
+        for point in geometry.findall ("mxPoint"):
+            if point.get ("as") == "sourcePoint":
+                cell.source_point = [number (point.get ("x")), number (point.get ("y"))]
+            elif point.get ("as") == "targetPoint":
+                cell.target_point = [number (point.get ("x")), number (point.get ("y"))]
+    return cell
+
+# Keeps a Cell for each cell element of a tab, fed with iterparse's start and end events. Once a cell has
+# been read, its XML is removed from the tree, so that only the elements that are still open are held.
+# The mxCell inside a UserObject (or object) is left in place until the wrapper ends, as it is read then.
+class Cell_Reader:
+    def __init__ (self):
+        self.cells = []
+        self.open = [] # elements started and not yet ended, outermost first
+        self.wrappers = 0 # UserObject / object elements open
+
+    def start (self, elem):
+        self.open.append (elem)
+        if elem.tag == "UserObject" or elem.tag == "object":
+            self.wrappers += 1
+
+    def end (self, elem):
+        self.open.pop ()
+        if elem.tag == "mxCell":
+            if self.wrappers == 0:
+                if elem.get ("id") != None:
+                    self.cells.append (make_cell (elem))
+                self.discard (elem)
+        elif elem.tag == "UserObject" or elem.tag == "object":
+            self.wrappers -= 1
+            inner = elem.find ("mxCell")
+            if inner != None:
+                self.cells.append (make_cell (inner, wrapper=elem))
+            self.discard (elem)
+
+    def discard (self, elem):
+        if 0 < len (self.open):
+            self.open [-1].remove (elem)
+        elem.clear ()
+
+# Yields [tab name, [Cell, ...]] for each tab in the file, in file order.
+# `source` is the file name, or an open binary file.
+def read_tabs (fname, source):
+    name = None
+    reader = Cell_Reader ()
+    for event, elem in ET.iterparse (source, events=("start", "end")):
+        if elem.tag == "diagram":
+            if event == "start":
+                name = elem.get ("name")
+                reader = Cell_Reader ()
+            else:
+                cells = reader.cells
+                blob = (elem.text or "").strip ()
+                if 0 == len (cells) and blob != "":
+                    cells = read_compressed_cells (fname, name, blob)
+                if cells != None:
+                    yield [name, cells]
+                elem.clear ()
+        elif event == "start":
+            reader.start (elem)
+        else:
+            reader.end (elem)
+
+# Compressed tabs.
+#
+# Unless compression is turned off, draw.io stores each tab as base64 (deflate (encodeURIComponent (xml))).
+# Tabs are only decoded when they have to be transpiled (unchanged tabs are skipped by `transpile`
+# before they get here), and decoded XML is kept by the hash of the compressed text, so a tab is
+# never inflated twice while it stays the same.
+
+max_decoded_tabs = 64
+decoded_tabs = collections.OrderedDict () # hash of compressed text -> XML, least recently used first
+
+def decompress_tab (blob):
+    h = hashlib.sha256 (blob.encode ('utf-8')).hexdigest ()
+    if h in decoded_tabs:
+        decoded_tabs.move_to_end (h)
+        return decoded_tabs [h]
+    deflated = base64.b64decode (blob, validate=True)
+    escaped = zlib.decompress (deflated, -zlib.MAX_WBITS) # raw deflate, no zlib header
+    xml = unquote_in_pieces (escaped)
+    decoded_tabs [h] = xml
+    while len (decoded_tabs) > max_decoded_tabs:
+        decoded_tabs.popitem (last=False)
+    return xml
+
+# urllib.parse.unquote splits its whole input at every "%" first, which for a large tab (where most of the
+# XML's punctuation is escaped) costs many times the size of the tab - so it is unquoted a piece at a time
+unquote_piece_size = 1 << 16
+
+def unquote_in_pieces (escaped):
+    pieces = []
+    start = 0
+    while start < len (escaped):
+        end = min (start + unquote_piece_size, len (escaped))
+        if end < len (escaped):
+            # don't split a %XX escape
+            percent = escaped.rfind (b"%", end - 2, end)
+            if percent >= 0:
+                end = percent
+        pieces.append (urllib.parse.unquote_to_bytes (escaped [start:end]))
+        start = end
+    return b"".join (pieces)
+
+def read_compressed_cells (fname, tabname, blob):
+    try:
+        xml = decompress_tab (blob)
+    except (ValueError, zlib.error) as e:
+        output.append ("error", f"{fname}: tab {tabname} could not be decompressed: {e}")
+        return None
+    reader = Cell_Reader ()
+    for event, elem in ET.iterparse (io.BytesIO (xml), events=("start", "end")):
+        if event == "start":
+            reader.start (elem)
+        else:
+            reader.end (elem)
+    return reader.cells
+
+# A uniform grid over rectangles. Each rectangle is filed under every grid square it overlaps,
+# so a point query only looks at the few rectangles filed under the point's square.
+class Grid_Index:
+    def __init__ (self, cell_size):
+        self.cell_size = cell_size
+        self.buckets = {}
+
+    def insert (self, item, x, y, width, height):
+        entry = [item, x, y, x + width, y + height]
+        rows = range (self.grid (y), self.grid (y + height) + 1)
+        for gx in range (self.grid (x), self.grid (x + width) + 1):
+            for gy in rows:
+                key = (gx, gy)
+                if key in self.buckets:
+                    self.buckets [key].append (entry)
+                else:
+                    self.buckets [key] = [entry]
+
+    def grid (self, v):
+        return int (v // self.cell_size)
+
+    def query_point (self, px, py):
+        # returns the items whose rectangles contain the point
+        hits = []
+        for [item, x0, y0, x1, y1] in self.buckets.get ((self.grid (px), self.grid (py)), ()):
+            if x0 <= px <= x1 and y0 <= py <= y1:
+                hits.append (item)
+        return hits
+
+def make_index (cells):
+    # grid squares about the size of a typical shape keep both the buckets and the number of buckets per shape small
+    sizes = sorted (max (cell.width, cell.height) for cell in cells)
+    cell_size = 1.0
+    if 0 < len (sizes):
+        cell_size = max (1.0, sizes [len (sizes) // 2])
+    index = Grid_Index (cell_size)
+    for cell in cells:
+        index.insert (cell, cell.x, cell.y, cell.width, cell.height)
+    return index
+
+def area (cell):
+    return cell.width * cell.height
+
+def smallest (cells):
+    best = None
+    for cell in cells:
+        if best == None or area (cell) < area (best):
+            best = cell
+    return best
+
+# draw.io stores each cell's geometry relative to its parent cell - convert every vertex to
+# absolute coordinates (and arrow end points, which are relative to the arrow's parent)
+def place_absolutely (cells, cells_by_id):
+    absolute = {} # vertex id -> [x, y]
+    for cell in cells:
+        if cell.vertex:
+            absolute_position (cell, cells_by_id, absolute)
+    for cell in cells:
+        if cell.edge:
+            [ox, oy] = absolute.get (cell.parent, [0.0, 0.0])
+            if cell.source_point != None:
+                cell.source_point = [cell.source_point [0] + ox, cell.source_point [1] + oy]
+            if cell.target_point != None:
+                cell.target_point = [cell.target_point [0] + ox, cell.target_point [1] + oy]
+    for cell in cells:
+        if cell.vertex:
+            [cell.x, cell.y] = absolute [cell.id]
+
+def absolute_position (cell, cells_by_id, absolute):
+    # walk up to the first ancestor that is already placed (or to the layer), then place the chain top-down
+    chain = []
+    c = cell
+    while c != None and c.vertex and not (c.id in absolute):
+        chain.append (c)
+        c = cells_by_id.get (c.parent)
+    [x, y] = [0.0, 0.0]
+    if c != None and c.id in absolute:
+        [x, y] = absolute [c.id]
+    for c in reversed (chain):
+        x += c.x
+        y += c.y
+        absolute [c.id] = [x, y]
+    return absolute [cell.id]
+
+class Endpoint:
+    def __init__ (self, component=None, port=""):
+        self.component = component # None means "self" - the container
+        self.port = port
+
+def resolve_endpoint (fname, tabname, edge, cell_id, point, cells_by_id, components, ports, endpoint_index):
+    if cell_id != None:
+        cell = cells_by_id.get (cell_id)
+        if cell == None:
+            output.append ("error", f"{fname}: tab {tabname}: arrow {edge.id} is attached to unknown cell {cell_id}")
+            return None
+    elif point != None:
+        cell = smallest (endpoint_index.query_point (point [0], point [1]))
+        if cell == None:
+            output.append ("error", f"{fname}: tab {tabname}: arrow {edge.id} has an end that is not on any shape")
+            return None
+    else:
+        output.append ("error", f"{fname}: tab {tabname}: arrow {edge.id} is not attached at both ends")
+        return None
+    if cell.id in ports:
+        return Endpoint (ports [cell.id], cell.value)
+    elif cell.id in components:
+        return Endpoint (cell, "")
+    elif is_gate (cell):
+        return Endpoint (None, cell.value)
+    else:
+        output.append ("error", f"{fname}: tab {tabname}: arrow {edge.id} is attached to {cell.value!r}, which is not a port")
+        return None
+
+def connection_direction (source, target):
+    if source.component == None and target.component == None:
+        return enumThrough
+    elif source.component == None:
+        return enumDown
+    elif target.component == None:
+        return enumUp
+    else:
+        return enumAcross
+
+def container_from_cells (fname, tabname, cells):
+    cells_by_id = {}
+    layers = set ()
+    for cell in cells:
+        cells_by_id [cell.id] = cell
+        if not (cell.vertex or cell.edge):
+            layers.add (cell.id) # the root cell and the layers that hold the drawing
+    place_absolutely (cells, cells_by_id)
+    # shapes drawn directly on the diagram are components, unless they sit inside another shape,
+    # in which case they are ports of the smallest shape that contains their centre
+    shapes = []
+    for cell in cells:
+        if cell.vertex and (cell.parent in layers) and not (is_gate (cell) or is_comment (cell)):
+            shapes.append (cell)
+    shape_index = make_index (shapes)
+    owners = {}
+    for cell in shapes:
+        cx = cell.x + cell.width / 2
+        cy = cell.y + cell.height / 2
+        containers = [c for c in shape_index.query_point (cx, cy) if c is not cell and area (c) > area (cell)]
+        if 0 < len (containers):
+            owners [cell.id] = smallest (containers)
+    components = {}
+    children = []
+    child_ids = {}
+    for cell in shapes:
+        if not (cell.id in owners):
+            components [cell.id] = cell
+            child_ids [cell.id] = len (children) + 1 # 0 stands for "self"
+            children.append ({"name": cell.value, "id": child_ids [cell.id]})
+    ports = {}
+    for cell in cells:
+        if cell.vertex and (cell.parent in components):
+            ports [cell.id] = components [cell.parent]
+    for id in owners:
+        owner = owners [id]
+        while owner.id in owners:
+            owner = owners [owner.id]
+        ports [id] = owner
+    endpoint_index = None
+    connections = []
+    for cell in cells:
+        if cell.edge:
+            if endpoint_index == None and (cell.source == None or cell.target == None):
+                endpoint_index = make_index ([c for c in cells if c.vertex and not is_comment (c) and (c.id in components or c.id in ports or is_gate (c))])
+            source = resolve_endpoint (fname, tabname, cell, cell.source, cell.source_point, cells_by_id, components, ports, endpoint_index)
+            target = resolve_endpoint (fname, tabname, cell, cell.target, cell.target_point, cells_by_id, components, ports, endpoint_index)
+            if source != None and target != None:
+                connections.append ({
+                    "dir": connection_direction (source, target),
+                    "source": endpoint_json (source, child_ids),
+                    "source_port": source.port,
+                    "target": endpoint_json (target, child_ids),
+                    "target_port": target.port
+                })
+    return {"file": fname, "name": tabname, "children": children, "connections": connections}
+
+def endpoint_json (endpoint, child_ids):
+    if endpoint.component == None:
+        return {"name": "", "id": 0}
+    else:
+        return {"name": endpoint.component.value, "id": child_ids [endpoint.component.id]}
+
+# Returns the XML of each tab, <diagram ...>...</diagram>, as it appears in the file.
+# Tabs do not nest, and "<" cannot appear unescaped inside attributes, so plain searching is enough.
+def split_tabs (data):
+    tabs = []
+    start = data.find (b'<diagram')
+    while start != -1:
+        open_end = data.find (b'>', start)
+        if open_end == -1:
+            break
+        if data [open_end - 1:open_end] == b'/':
+            end = open_end + 1
+        else:
+            end = data.find (b'</diagram>', open_end)
+            if end == -1:
+                break
+            end += len (b'</diagram>')
+        tabs.append (data [start:end])
+        start = data.find (b'<diagram', end)
+    return tabs
+
+# fname -> {hash of a tab's XML: [container]}, for the tabs seen in the last transpile of fname
+transpiled_tabs = {}
+
+# Returns the list of containers in the diagram file, or None if there were errors (see output "error").
+# `data` is the contents of the file, when the caller has already read it.
+def transpile (fname, data=None):
+    errors_before = len (output.get ().get ("error", ""))
+    try:
+        if data == None:
+            with open (fname, 'rb') as f:
+                data = f.read ()
+        previous = transpiled_tabs.get (fname, {})
+        current = {}
+        containers = []
+        tabs = split_tabs (data)
+        if 0 == len (tabs):
+            tabs = [data] # not an <mxfile> of <diagram>s - parse it as a whole
+        for tab in tabs:
+            h = hashlib.sha256 (tab).hexdigest ()
+            if h in previous:
+                tab_containers = previous [h]
+            else:
+                tab_containers = []
+                for [tabname, cells] in read_tabs (fname, io.BytesIO (tab)):
+                    tab_containers.append (container_from_cells (fname, tabname, cells))
+            current [h] = tab_containers
+            containers.extend (tab_containers)
+    except (OSError, ET.ParseError) as e:
+        output.append ("error", f"{fname}: {e}")
+        return None
+    if len (output.get ().get ("error", "")) != errors_before:
+        return None
+    transpiled_tabs [fname] = current
+    return containers
+
+def json_filename (fname):
+    return f'{fname}.json'
+
+def json_text (containers):
+    return json.dumps (containers, indent=4)
+
+def transpile_to_file (fname):
+    containers = transpile (fname)
+    if containers != None:
+        with open (json_filename (fname), 'w') as f:
+            f.write (json_text (containers))
+    return containers
+
+if __name__ == "__main__":
+    if None == transpile_to_file (sys.argv [1]):
+        print (output.get ().get ("error", ""), file=sys.stderr)
+        sys.exit (1)
@@ -6,13 +6,14 @@ import os
 import time
 
 import compile_and_run
+import run as runner
 
 inputBuffer = ""
 filenameBuffer = ""
 
-def run ():
+async def run (on_save=False):
     global inputBuffer, filenameBuffer
-    r = compile_and_run.compile_and_run (filenameBuffer, inputBuffer)
+    r = await compile_and_run.compile_and_run_async (filenameBuffer, inputBuffer, on_save)
     return r
 
 
@@ -36,7 +37,7 @@ async def file_watcher(wsock):
                 print ("*** changed ***")
                 last_mod_time = current_mod_time
                 print("File modified. Running diagram")
-                j = json.dumps (run ())
+                j = json.dumps (await run (on_save=True))
                 await wsock.send (j)
                 
             await asyncio.sleep(sample_time)
@@ -57,7 +58,7 @@ async def browser_ide(wsock):
             content = data ['content']
 
             if element_name == 'input' and (content != "" and content [-1] == '\n'):
-                j = json.dumps (run ())
+                j = json.dumps (await run ())
                 await wsock.send (j)
             elif element_name == 'input':
                 inputBuffer = content
@@ -73,6 +74,9 @@ async def file_watcher_server_handler(websocket):
 
 # Function to start both WebSocket servers
 async def start_servers():
+    # Warm up the diagram runners before the first edit arrives
+    runner.start_workers ()
+
     # Start WebSocket Server 1 on port 8765 (for file watcher)
     file_watcher_server = await websockets.serve(file_watcher_server_handler, "localhost", 8765)
     print("file watcher WebSocket server started on ws://localhost:8765")
@@ -0,0 +1,216 @@
+// Long-lived runner for <0D>/std/ohmjs.js, for the OhmJS component (see ohmjs_persistent in py0dws.py), so that
+// Node start-up, loading ohm-js and grammar compilation are not paid for every input.
+//
+// Requests and replies are JSON, length framed ("<byte count>\n<bytes>") on stdin and stdout:
+//   request: {"cwd": working directory, "zd": 0D path, "grammar_name": ..., "grammar": grammar file, "semantics": semantics file, "input": source}
+//   reply:   {"ok": true, "stdout": ..., "stderr": ..., "code": exit code}
+//            or {"ok": false, "error": ...} when ohmjs.js can't be run in here - the caller then runs it on its own
+//
+// Each request runs ohmjs.js's own code, as a fresh CommonJS module, just as `node ohmjs.js <grammar name>
+// <grammar file> <semantics file>` would: with those arguments in process.argv, the input as its stdin (read
+// with fs.readFileSync), and its stdout, stderr and exit code captured. The script is compiled once per
+// modification time. Its require ('ohm-js') gets ohm-js with `grammar` and `grammars` remembering what they
+// compiled, by grammar source text, so a grammar is only compiled again after it has been edited.
+//
+// Only replies go to stdout. Anything else written to it (e.g. by a script run after it has replied) is sent
+// to stderr instead, so that it can't break the framing.
+
+const fs = require('fs');
+const path = require('path');
+const vm = require('vm');
+const Module = require('module');
+
+const writeReply = process.stdout.write.bind(process.stdout);
+process.stdout.write = process.stderr.write.bind(process.stderr);
+
+const scripts = new Map(); // ohmjs.js path -> {mtime, run, require}
+const ohms = new Map(); // ohm-js module -> the same, remembering compiled grammars
+
+class Exit {
+    constructor(code) {
+        this.code = code;
+    }
+}
+
+class Unsupported extends Error {
+}
+
+let current = null; // {err, exited} of the run in progress
+
+// a script that exits from a callback throws Exit outside of runScript's try
+function uncaught(e) {
+    if (e instanceof Exit) {
+        return;
+    }
+    if (current !== null) {
+        current.err.push(String(e && e.stack ? e.stack : e) + '\n');
+        current.failed = true;
+    } else {
+        process.stderr.write(String(e && e.stack ? e.stack : e) + '\n');
+    }
+}
+process.on('uncaughtException', uncaught);
+process.on('unhandledRejection', uncaught);
+
+function rememberingOhm(ohm) {
+    let wrapped = ohms.get(ohm);
+    if (wrapped === undefined) {
+        const compiled = new Map(); // "grammar" or "grammars", source text -> result
+        const remember = (which) => function (source, ...rest) {
+            if (typeof source !== 'string' || rest.length !== 0) {
+                return ohm[which](source, ...rest);
+            }
+            const key = which + '\n' + source;
+            if (!compiled.has(key)) {
+                compiled.set(key, ohm[which](source));
+            }
+            return compiled.get(key);
+        };
+        wrapped = Object.create(ohm, { grammar: { value: remember('grammar') }, grammars: { value: remember('grammars') } });
+        ohms.set(ohm, wrapped);
+    }
+    return wrapped;
+}
+
+function scriptFor(fname) {
+    const mtime = fs.statSync(fname).mtimeMs;
+    let entry = scripts.get(fname);
+    if (entry === undefined || entry.mtime !== mtime) {
+        // as node does, a "#!" first line is skipped (kept as a comment, so that line numbers stay the same)
+        const source = fs.readFileSync(fname, 'utf-8').replace(/^#!/, '//');
+        if (/^\s*(import|export)\s/m.test(source)) {
+            throw new Unsupported(`${fname} is an ES module`);
+        }
+        const run = new vm.Script(Module.wrap(source), { filename: fname }).runInThisContext();
+        const realRequire = Module.createRequire(fname);
+        const scriptRequire = (name) => (name === 'ohm-js') ? rememberingOhm(realRequire(name)) : realRequire(name);
+        scriptRequire.resolve = realRequire.resolve;
+        scriptRequire.cache = realRequire.cache;
+        entry = { mtime: mtime, run: run, require: scriptRequire };
+        scripts.set(fname, entry);
+    }
+    return entry;
+}
+
+function isStdin(file) {
+    return file === 0 || file === '/dev/stdin';
+}
+
+// Runs the script as a process of its own would, and returns [stdout, stderr, exit code].
+async function runScript(fname, args, input) {
+    const script = scriptFor(fname);
+    const out = [];
+    const err = [];
+    const saved = {
+        argv: process.argv, exit: process.exit, exitCode: process.exitCode,
+        stdoutWrite: process.stdout.write, stderrWrite: process.stderr.write, readFileSync: fs.readFileSync,
+        stdin: Object.getOwnPropertyDescriptor(process, 'stdin')
+    };
+    const capture = (into) => function (chunk, encoding, callback) {
+        into.push(typeof chunk === 'string' ? chunk : Buffer.from(chunk).toString('utf-8'));
+        const done = (typeof encoding === 'function') ? encoding : callback;
+        if (typeof done === 'function') {
+            process.nextTick(done);
+        }
+        return true;
+    };
+    const run = { err: err, exited: null, failed: false };
+    let code = 0;
+    process.argv = [process.execPath, fname, ...args];
+    process.exitCode = undefined;
+    process.exit = (c) => {
+        if (run.exited === null) {
+            run.exited = (c === undefined ? process.exitCode : c) || 0;
+        }
+        throw new Exit(run.exited);
+    };
+    process.stdout.write = capture(out);
+    process.stderr.write = capture(err);
+    fs.readFileSync = function (file, options) {
+        if (!isStdin(file)) {
+            return saved.readFileSync.apply(fs, arguments);
+        }
+        const encoding = (typeof options === 'string') ? options : (options && options.encoding);
+        return encoding ? input : Buffer.from(input, 'utf-8');
+    };
+    Object.defineProperty(process, 'stdin', {
+        configurable: true,
+        get: () => { throw new Unsupported(`${fname} reads process.stdin as a stream`); }
+    });
+    current = run;
+    try {
+        const mod = new Module(fname, null);
+        mod.filename = fname;
+        mod.paths = Module._nodeModulePaths(path.dirname(fname));
+        const scriptRequire = (name) => script.require(name);
+        Object.assign(scriptRequire, script.require);
+        scriptRequire.main = mod;
+        try {
+            script.run.call(mod.exports, mod.exports, scriptRequire, mod, fname, path.dirname(fname));
+            // let promise callbacks and immediates that the script queued run, as they would before it exits
+            await new Promise((resolve) => setImmediate(resolve));
+        } catch (e) {
+            if (e instanceof Exit) {
+                // recorded in run.exited
+            } else if (e instanceof Unsupported) {
+                throw e;
+            } else {
+                // an uncaught exception: node prints it and exits with 1
+                uncaught(e);
+            }
+        }
+        if (run.exited !== null) {
+            code = run.exited;
+        } else if (run.failed) {
+            code = 1;
+        } else {
+            code = process.exitCode || 0;
+        }
+    } finally {
+        current = null;
+        process.argv = saved.argv;
+        process.exit = saved.exit;
+        process.exitCode = saved.exitCode;
+        process.stdout.write = saved.stdoutWrite;
+        process.stderr.write = saved.stderrWrite;
+        fs.readFileSync = saved.readFileSync;
+        Object.defineProperty(process, 'stdin', saved.stdin);
+    }
+    return [out.join(''), err.join(''), code];
+}
+
+async function parse(req) {
+    try {
+        process.chdir(req.cwd);
+        const script = path.resolve(req.zd, 'std', 'ohmjs.js');
+        const [stdout, stderr, code] = await runScript(script, [req.grammar_name, req.grammar, req.semantics], req.input);
+        return { ok: true, stdout: stdout, stderr: stderr, code: code };
+    } catch (e) {
+        return { ok: false, error: String(e && e.stack ? e.stack : e) };
+    }
+}
+
+function reply(r) {
+    const body = Buffer.from(JSON.stringify(r), 'utf-8');
+    writeReply(Buffer.concat([Buffer.from(`${body.length}\n`, 'ascii'), body]));
+}
+
+let buffer = Buffer.alloc(0);
+let requests = Promise.resolve(); // requests are run one at a time, in arrival order
+
+process.stdin.on('data', (chunk) => {
+    buffer = Buffer.concat([buffer, chunk]);
+    while (true) {
+        const headerEnd = buffer.indexOf(10); // "\n"
+        if (headerEnd < 0) {
+            break;
+        }
+        const end = headerEnd + 1 + parseInt(buffer.subarray(0, headerEnd).toString('ascii'), 10);
+        if (buffer.length < end) {
+            break;
+        }
+        const req = JSON.parse(buffer.subarray(headerEnd + 1, end).toString('utf-8'));
+        buffer = buffer.subarray(end);
+        requests = requests.then(() => parse(req)).then(reply);
+    }
+});
@@ -4,7 +4,19 @@ import sys
 import re
 import subprocess
 import shlex
-import queue
+import select
+import tempfile
+import time
+import atexit
+import collections
+import io
+import gc
+import concurrent.futures
+import asyncio
+import inspect
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
 
 import output
 
@@ -41,146 +53,149 @@ def subscripted_digit (n):
     else:
         return f"₊{n}"
     
+# Datums are the payloads of messages.
+#
+# Every kind of datum supports the same calls - clone (), reclaim (), srepr (), raw () and kind ().
+# Each kind is a small slotted class with ordinary methods, so a datum costs one object and no
+# per-instance closures. Bang and tick datums carry no data and are shared singletons.
+#
+# Datums are immutable once made: their payloads are Python str / bytes / int (or read-only views of
+# bytes), which cannot be changed in place, so clone () returns the datum itself and fanning a message
+# out to N receivers shares one payload - each receiver gets only its own `Message` envelope. A leaf
+# that wants to modify a payload builds a new datum from it (e.g. `new_datum_bytes (bytearray (d.raw ()))`).
+
 class Datum:
-  def __init__(self):
-    self.data = None
-    self.clone = None
-    self.reclaim = None
-    self.srepr = None
-    self.kind = None
-    self.raw = None
+    __slots__ = ("data",)
 
-def new_datum_string (s):
-    d = Datum ()
-    d.data = s
-    d.clone = lambda : clone_datum_string (d)
-    d.reclaim = lambda : reclaim_datum_string (d)    
-    d.srepr = lambda : srepr_datum_string (d)
-    d.raw = lambda : raw_datum_string (d)    
-    d.kind = lambda : "string"
-    return d
+    def __init__ (self, data=None):
+        self.data = data
 
-def clone_datum_string (d):
-  d = new_datum_string (d.data)
-  return d
+    def clone (self):
+        return self
 
-def reclaim_datum_string (src):
-  pass
+    def reclaim (self):
+        pass
 
-def srepr_datum_string (d):
-  return d.data
+    def srepr (self):
+        return ""
 
-def raw_datum_string (d):
-  return bytearray (d.data,'UTF-8')
+    def raw (self):
+        return self.data
 
+    def kind (self):
+        return "datum"
 
+class Datum_String (Datum):
+    __slots__ = ()
 
-def new_datum_bang ():
-    p = Datum ()
-    p.data = True
-    p.clone = lambda : clone_datum_bang (p)
-    p.reclaim = lambda : reclaim_datum_bang (p)
-    p.srepr = lambda : srepr_datum_bang ()
-    p.raw = lambda : raw_datum_bang ()    
-    p.kind = lambda : "bang"
-    return p
+    def srepr (self):
+        return self.data
 
-def clone_datum_bang (d):
-    return new_datum_bang ()
+    def raw (self):
+        return bytearray (self.data,'UTF-8')
 
+    def kind (self):
+        return "string"
 
-def reclaim_datum_bang (d):
-    pass
+def new_datum_string (s):
+    return Datum_String (s)
 
-def srepr_datum_bang ():      
-    return "!"
 
-def raw_datum_bang ():
-    return []
+class Datum_Bang (Datum):
+    __slots__ = ()
 
+    def srepr (self):
+        return "!"
 
+    def raw (self):
+        return []
 
-def new_datum_tick ():      
-    p = new_datum_bang ()
-    p.kind = lambda : "tick"
-    p.clone = lambda : new_datum_tick ()
-    p.srepr = lambda : srepr_datum_tick ()
-    p.raw = lambda : raw_datum_tick ()
-    return p
+    def kind (self):
+        return "bang"
 
+bang_datum = Datum_Bang (True)
 
-def srepr_datum_tick ():
-    return "."
+def new_datum_bang ():
+    return bang_datum
 
 
-def raw_datum_tick ():      
-    return []
+class Datum_Tick (Datum_Bang):
+    __slots__ = ()
 
+    def srepr (self):
+        return "."
 
-def new_datum_bytes (b):      
-    p = Datum ()
-    p.data = b[:]
-    p.clone = clone_datum_bytes
-    p.reclaim = lambda : reclaim_datum_bytes (p)
-    p.srepr = lambda : srepr_datum_bytes (b)
-    p.raw = lambda : raw_datum_bytes (b)
-    p.kind = lambda : "bytes"
-    return p
+    def kind (self):
+        return "tick"
 
+tick_datum = Datum_Tick (True)
 
-def clone_datum_bytes (src):      
-    p = Datum ()
-    p = src
-    p.data = src.clone ()
-    return p
+def new_datum_tick ():      
+    return tick_datum
 
 
-def reclaim_datum_bytes (src):      
-    pass
+# A bytes datum's payload is `bytes`, or a read-only `memoryview` (of bytes, or of a file mapped with
+# mmap.ACCESS_READ), and it is never copied: slice () makes a datum for part of the payload that shares
+# its memory, and the payload is only decoded to a string (once) when srepr () is first called.
+class Datum_Bytes (Datum):
+    __slots__ = ("text",)
 
+    def __init__ (self, data=None):
+        self.data = data
+        self.text = None
 
-def srepr_datum_bytes (d):
-    return d.data.decode ('utf-8')
+    def srepr (self):
+        if self.text == None:
+            self.text = str (self.data, 'utf-8')
+        return self.text
 
+    def raw (self):
+        return self.data
 
-def raw_datum_bytes (d):
-    return d.data
+    def kind (self):
+        return "bytes"
 
+    def slice (self, start, stop=None):
+        return Datum_Bytes (memoryview (self.data) [start:stop])
 
+    def __reduce__ (self):
+        # memoryviews can't be pickled (e.g. on their way to process_pool), the bytes they show can
+        return (new_datum_bytes, (bytes (self.data),))
 
-def new_datum_handle (h):
-    return new_datum_int (h)
+def new_datum_bytes (b):      
+    # bytes and read-only views are kept as they are, mutable buffers (bytearray, writable views) are frozen with a single copy
+    if isinstance (b, bytes):
+        return Datum_Bytes (b)
+    if isinstance (b, memoryview) and b.readonly:
+        return Datum_Bytes (b if b.format == 'B' else b.cast ('B'))
+    return Datum_Bytes (bytes (b))
 
-def new_datum_int (i):      
-    p = Datum ()
-    p.data = i
-    p.clone = lambda : clone_int (i)
-    p.reclaim = lambda : reclaim_int (i)
-    p.srepr = lambda: srepr_datum_int (i)
-    p.raw = lambda : raw_datum_int (i)
-    p.kind = lambda : "int"
-    return p
 
+class Datum_Int (Datum):
+    __slots__ = ()
 
-def clone_int (i):      
-    p = Datum ()
-    p = new_datum_int (i)
-    return p
+    def srepr (self):
+        return str (self.data)
 
+    def raw (self):
+        return self.data
 
-def reclaim_int (src):      
-    pass
+    def kind (self):
+        return "int"
 
-def srepr_datum_int (i):
-  return str (i)
+def new_datum_handle (h):
+    return new_datum_int (h)
+
+def new_datum_int (i):      
+    return Datum_Int (i)
 
-def raw_datum_int (i):      
-    return i
 # Message passed to a leaf component.
 #
 # `port` refers to the name of the incoming or outgoing port of this component.
 # `datum` is the data attached to this message.
 class Message:
+    __slots__ = ("port", "datum")
+
     def __init__ (self, port, datum):
         self.port = port
         self.datum = datum
@@ -190,7 +205,8 @@ def clone_port (s):
 
 
 # Utility for making a `Message`. Used to safely "seed" messages
-# entering the very top of a network.
+# entering the very top of a network. Datums are immutable, so the
+# new message shares its payload with `datum` (see Datum).
 
 def make_message (port, datum):
     p = clone_string (port)
@@ -232,6 +248,28 @@ drUp = "up"
 drAcross = "across"
 drThrough = "through"
 
+# routing trace levels, chosen once per run by `set_trace_level` (see `start`)
+#   off     - nothing is recorded, and the kernel skips building descriptors altogether
+#   summary - each container counts its routing actions (inject, send, down, across, ...), no messages are kept
+#   full    - each container keeps its most recent `trace_capacity` descriptors in a ring buffer
+
+traceOff = "off"
+traceSummary = "summary"
+traceFull = "full"
+
+trace_level = traceOff
+default_trace_capacity = 10000
+trace_capacity = default_trace_capacity
+tracing = False # trace_level != traceOff, tested by the kernel before calling any log_* function
+
+def set_trace_level (level, capacity=None):
+    global trace_level, trace_capacity, tracing
+    if level not in [traceOff, traceSummary, traceFull]:
+        load_error (f"unknown trace level {level}, expected one of {traceOff}, {traceSummary}, {traceFull}")
+    trace_level = level
+    trace_capacity = capacity if capacity != None else default_trace_capacity
+    tracing = (level != traceOff)
+
 # See "class free programming" starting at 45:01 of https://www.youtube.com/watch?v=XFTOG895C7c
 
 def make_Routing_Descriptor (action=None, component=None, port=None, message=None):
@@ -257,11 +295,17 @@ def make_Send_Descriptor (component=None, port=None, message=None, cause_port=No
         "fmt": fmt_send
         }
 
+# A blocking leaf's stand-in sends from a worker thread, so its sends are not logged here - they are logged
+# by finish_blocking_call when they are handed on to the blocking leaf, on the kernel's thread.
 def log_send (sender, sender_port, msg, cause_msg):
+    if sender.kind == "stand-in":
+        return
     send_desc = make_Send_Descriptor (component=sender, port=sender_port, message=msg, cause_port=cause_msg.port, cause_message=cause_msg)
     append_routing_descriptor (container=sender.owner, desc=send_desc)
 
 def log_send_string (sender, sender_port, msg, cause_msg):
+    if sender.kind == "stand-in":
+        return
     send_desc = make_Send_Descriptor (sender, sender_port, msg, cause_msg.port, cause_msg)
     append_routing_descriptor (container=sender.owner, desc=send_desc)
 
@@ -412,7 +456,7 @@ def log_inout (container=None, component=None, in_message=None):
     if component.outq.empty ():
         log_inout_no_output (container=container, component=component, in_message=in_message)
     else:
-        log_inout_recursively (container=container, component=component, in_message=in_message, out_messages=list (component.outq.queue))
+        log_inout_each (container=container, component=component, in_message=in_message, out_messages=component.outq)
 
 def log_inout_no_output (container=None, component=None, in_message=None):
     rdesc = make_InOut_Descriptor (container=container, component=component, in_message=in_message)
@@ -422,14 +466,9 @@ def log_inout_single (container=None, component=None, in_message=None, out_messa
     rdesc = make_InOut_Descriptor (container=container, component=component, in_message=in_message, out_message=out_message)
     append_routing_descriptor (container, rdesc)
 
-def log_inout_recursively (container=None, component=None, in_message=None, out_messages=[]):
-    if [] == out_messages:
-        pass
-    else:
-        m = out_messages [0]
-        rest = out_messages [1:]
+def log_inout_each (container=None, component=None, in_message=None, out_messages=[]):
+    for m in out_messages:
         log_inout_single (container=container, component=component, in_message=in_message, out_message=m)
-        log_inout_recursively (container=container, component=component, in_message=in_message, out_messages=rest)
 
 def fmt_inout (desc, indent):
     outm = desc ["out_message"]
@@ -443,18 +482,63 @@ def log_tick (container=None, component=None, in_message=None):
 
         
 ####
+# Routing traces are formatted one descriptor at a time and written straight to `f`,
+# which can be any text stream - an open file, `sys.stdout`, an `io.StringIO`, or a
+# socket wrapped with `sock.makefile ("w", encoding="utf-8")` - so that long traces
+# are never held in memory as one string.
+
+max_trace_indent = 40 # each entry is indented one step deeper than the last, up to this many steps
+
 def routing_trace_all (container):
-    indent = ""
-    lis = list (container.routings.queue)
-    return recursive_routing_trace (container, lis, indent)
+    f = io.StringIO ()
+    write_routing_trace (container, f)
+    return f.getvalue ()
 
-def recursive_routing_trace (container, lis, indent):
-    if [] == lis:
-        return ''
+def write_routing_trace (container, f):
+    if trace_level == traceSummary:
+        f.write (routing_summary (container))
+    else:
+        depth = 0
+        for desc in container.routings:
+            f.write (desc ["fmt"] (desc, '  ' * depth))
+            if depth < max_trace_indent:
+                depth += 1
+
+# Writes the trace as JSON Lines, one object per routing descriptor (or per action count,
+# when tracing at traceSummary). Components are written as their names, and messages as
+# {"port", "kind", "datum"}.
+def export_routing_trace_jsonl (container, f):
+    if trace_level == traceSummary:
+        for action in container.routing_counts:
+            write_jsonl (f, {"container": container.name, "action": action, "count": container.routing_counts [action]})
+    else:
+        for desc in container.routings:
+            write_jsonl (f, routing_descriptor_to_json (container, desc))
+
+def write_jsonl (f, obj):
+    f.write (json.dumps (obj, ensure_ascii=False))
+    f.write ("\n")
+
+def routing_descriptor_to_json (container, desc):
+    j = {"container": container.name}
+    for key in desc:
+        if key != "fmt" and key != "container":
+            j [key] = trace_value_to_json (desc [key])
+    return j
+
+def trace_value_to_json (v):
+    if isinstance (v, Eh):
+        return v.name
+    elif isinstance (v, Message):
+        return {"port": v.port, "kind": v.datum.kind (), "datum": v.datum.srepr ()}
     else:
-        desc = first (lis)
-        formatted = desc ["fmt"] (desc, indent)
-        return formatted + recursive_routing_trace (container, rest (lis), indent + '  ')
+        return v
+
+def routing_summary (container):
+    s = ""
+    for action in container.routing_counts:
+        s = f'{s}\n{container.name} {action} {container.routing_counts [action]}'
+    return s
 
 ####
 def first (arr): # called "car" in Lisp
@@ -470,70 +554,159 @@ enumAcross = 1
 enumUp = 2
 enumThrough = 3
 
+# When `lazy_containers` is set (see `start`), a container below the top level is created empty,
+# and its children and connections are only instantiated when it handles its first message.
+# The container is filled in place, so the connections that already point at its queues
+# stay valid. Sub-networks that never receive a message are never instantiated.
+lazy_containers = False
+
 def container_instantiator (reg, owner, container_name, desc):
-    global enumDown, enumUp, enumAcross, enumThrough
     container = make_container (container_name, owner)
-    children = []
-    children_by_id = {} # not strictly necessary, but, we can remove 1 runtime lookup by "compiling it out" here
-    # collect children
+    plan = instantiation_plan (reg, desc)
+    if lazy_containers and owner != None:
+        container.handler = lazy_container_handler
+        container.instance_data = [reg, plan]
+    elif owner == None:
+        # instantiating a whole network allocates many small objects that live as long as the network,
+        # and the cyclic collector would repeatedly re-scan them while they are being built
+        collecting = gc.isenabled ()
+        gc.disable ()
+        try:
+            fill_container (reg, container, plan)
+        finally:
+            if collecting:
+                gc.enable ()
+    else:
+        fill_container (reg, container, plan)
+    return container
+
+def lazy_container_handler (container, message):
+    [reg, plan] = container.instance_data
+    container.instance_data = None
+    fill_container (reg, container, plan)
+    container.handler = container_handler
+    container_handler (container, message)
+
+# An instantiation plan is a container descriptor compiled once per template: the names of its children,
+# and its connections with the children's ids already resolved to indices into the children list
+# (selfIndex standing for the container itself). Every instance of the template is stamped out from
+# the same plan, instead of re-walking the JSON.
+selfIndex = -1
+
+class Instantiation_Plan:
+    def __init__ (self):
+        self.child_names = []
+        self.connections = [] # [direction, source index, source port, target index, target port]
+
+def make_instantiation_plan (desc):
+    global enumDown, enumUp, enumAcross, enumThrough
+    plan = Instantiation_Plan ()
+    index_by_id = {}
     for child_desc in desc ["children"]:
-        child_instance = get_component_instance (reg, child_desc ["name"], container)
-        children.append (child_instance)
-        children_by_id [child_desc ["id"]] = child_instance
+        index_by_id [child_desc ["id"]] = len (plan.child_names)
+        plan.child_names.append (child_desc ["name"])
+    for proto_conn in desc ["connections"]:
+        # JSON: {'dir': 0, 'source': {'name': '', 'id': 0}, 'source_port': '', 'target': {'name': 'Echo', 'id': 12}, 'target_port': ''},
+        # an unknown child id is kept as None, and reported by fill_container
+        dir = proto_conn ['dir']
+        if dir == enumDown:
+            direction = "down"
+            source = selfIndex
+            target = index_by_id.get (proto_conn ['target'] ['id'])
+        elif dir == enumAcross:
+            direction = "across"
+            source = index_by_id.get (proto_conn ['source'] ['id'])
+            target = index_by_id.get (proto_conn ['target'] ['id'])
+        elif dir == enumUp:
+            direction = "up"
+            source = index_by_id.get (proto_conn ['source'] ['id'])
+            target = selfIndex
+        elif dir == enumThrough:
+            direction = "through"
+            source = selfIndex
+            target = selfIndex
+        else:
+            continue
+        plan.connections.append ([direction, source, proto_conn ['source_port'], target, proto_conn ['target_port']])
+    return plan
+
+# Returns the plan for `desc`, compiling it into its template on first use.
+def instantiation_plan (reg, desc):
+    template = reg.templates.get (mangle_name (desc ['name']))
+    if template == None or not (template.template_data is desc):
+        return make_instantiation_plan (desc)
+    if template.plan == None:
+        template.plan = make_instantiation_plan (desc)
+    return template.plan
+
+# Instantiates the children and connections of `container`, as described by `plan`.
+def fill_container (reg, container, plan):
+    children = [get_component_instance (reg, name, container) for name in plan.child_names]
     container.children = children
-    self = container
-    
     connectors = []
-    for proto_conn in desc ["connections"]:
-        source_component = None
-        target_component = None
-        connector = Connector ()
-        if proto_conn ['dir'] == enumDown:
-            # JSON: {'dir': 0, 'source': {'name': '', 'id': 0}, 'source_port': '', 'target': {'name': 'Echo', 'id': 12}, 'target_port': ''},
-            connector.direction = "down"
-            connector.sender = Sender (self.name, self, proto_conn ['source_port'])
-            target_component = children_by_id [proto_conn ['target'] ['id']]
-            if (target_component == None):
-                load_error (f"internal error: .Down connection target internal error {proto_conn['target']}")
-            else:
-                connector.receiver = Receiver (target_component.name, target_component.inq, proto_conn ['target_port'], target_component)
-                connectors.append (connector)
-        elif proto_conn ["dir"] == enumAcross:
-            connector.direction = "across"
-            source_component = children_by_id [proto_conn ['source']['id']]
-            target_component = children_by_id [proto_conn ['target'] ['id']]
-            if source_component == None:
-                load_error (f"internal error: .Across connection source not ok {proto_conn ['source']}")
-            else:
-                connector.sender = Sender (source_component.name, source_component, proto_conn ['source_port'])
-                if target_component == None:
-                    load_error (f"internal error: .Across connection target not ok {proto_conn.target}")
-                else:
-                    connector.receiver = Receiver (target_component.name, target_component.inq, proto_conn ['target_port'], target_component)
-                    connectors.append (connector)
-        elif proto_conn ['dir'] == enumUp:
-            connector.direction = "up"
-            source_component = children_by_id [proto_conn ['source']['id']]
-            if source_component == None:
-                output.append ("error",f"internal error: .Up connection source not ok {proto_conn ['source']}")
+    for [direction, source, source_port, target, target_port] in plan.connections:
+        if source == selfIndex:
+            source_component = container
+        elif source == None:
+            source_component = None
+        else:
+            source_component = children [source]
+        if target == selfIndex:
+            target_component = container
+        elif target == None:
+            target_component = None
+        else:
+            target_component = children [target]
+        if source_component == None:
+            load_error (f"internal error: .{direction} connection source not ok in {container.name}")
+        elif target_component == None:
+            load_error (f"internal error: .{direction} connection target not ok in {container.name}")
+        else:
+            connector = Connector ()
+            connector.direction = direction
+            connector.sender = Sender (source_component.name, source_component, source_port)
+            if target == selfIndex:
+                connector.receiver = Receiver (container.name, container.outq, target_port, container)
             else:
-                connector.sender = Sender (source_component.name, source_component, proto_conn ['source_port'])
-                connector.receiver = Receiver (self.name, container.outq, proto_conn ['target_port'], self)
-                connectors.append (connector)
-        elif proto_conn ['dir'] == enumThrough:
-            connector.direction = "through"
-            connector.sender = Sender (self.name, self, proto_conn ['source_port'])
-            connector.receiver = Receiver (self.name, container.outq, proto_conn ['target_port'], self)
+                connector.receiver = Receiver (target_component.name, target_component.inq, target_port, target_component)
             connectors.append (connector)
-            
     container.connections = connectors
-    return container
+    container.routing_index = make_routing_index (connectors)
+
+# Precompiles a container's connections into a dispatch table keyed by (sender component, sender port),
+# so that `route` does one dictionary lookup per message instead of scanning every connector.
+# Connectors keep their declaration order within each entry.
+def make_routing_index (connectors):
+    index = {}
+    for connector in connectors:
+        key = (connector.sender.component, connector.sender.port)
+        if key in index:
+            index [key].append (connector)
+        else:
+            index [key] = [connector]
+    return index
 
 # The default handler for container components.
+# When only long-running children are left (e.g. blocking leaves waiting for their worker threads),
+# a sub-container returns "active" instead of spinning, so that its owner can get on with its other
+# children and tick it again later. The top-level container has nobody to return to, so it sleeps
+# until a blocking call finishes.
+# A sub-container also returns after any pass that leaves output on its outq, so that its owner routes
+# the output as it is made - a producer inside it (e.g. Read File Chunks) then streams to the rest of
+# the network a piece at a time, instead of piling every piece up on the outq before any is delivered.
 def container_handler (container, message):
     route (container=container, from_component=container, message=message) # references to 'self' are replaced by the container during instantiation
     while any_child_ready (container):
-        step_children (container, message)
+        if step_children (container, message):
+            if container.owner != None and 0 < len (container.outq):
+                break
+        elif container.owner != None:
+            break
+        else:
+            check_for_deadlock (container)
+            wait_for_blocking_calls ()
+    if any_child_ready (container):
+        container.state = "active" # still has work to do, so its owner ticks it again
 
 # Frees the given container and associated data.
 def destroy_container (eh):      
@@ -577,7 +750,8 @@ def sender_eq (s1, s2):
 # Delivers the given message to the receiver of this connector.
 def deposit (parent, conn, message):
     new_message = make_message (port=conn.receiver.port, datum=message.datum)
-    log_connection (parent, conn, new_message)
+    if tracing:
+        log_connection (parent, conn, new_message)
     push_message (parent, conn.receiver.component, conn.receiver.queue, new_message)
 
 
@@ -589,7 +763,10 @@ def force_tick (parent, eh):
 
 def push_message (parent, receiver, inq, m):      
     inq.put (m)
-    parent.visit_ordering.put (receiver)
+    waiting = len (inq) + len (inq.pending)
+    if waiting > inq.high_water:
+        inq.high_water = waiting
+    schedule (parent, receiver)
 
 
 def is_self (child, container):
@@ -610,42 +787,66 @@ def save_message (eh, msg):
 def fetch_saved_message_and_clear (eh):
     return eh.saved_messages.get ()
 
+# Steps each child that is waiting in the container's run queue (`visit_ordering`) once, in delivery order.
+# Only the children that were queued when the pass began are visited - children that become ready during
+# the pass are queued behind them and are visited on the next pass.
+# Returns False when the pass only ticked long-running children that neither finished nor produced output.
 def step_children (container, causingMessage):      
     container.state = "idle"
-    for child in list (container.visit_ordering.queue):
-        # child == container represents self, skip it
-        if (not (is_self (child, container))):
-            if (not (child.inq.empty ())):
-                msg = child.inq.get ()
-                [began_long_run, continued_long_run, ended_long_run] = step_child (child, msg)
-                if began_long_run:
-                    save_message (child, msg)
-                elif continued_long_run:
-                    pass
-                elif ended_long_run:
-                    log_inout (container=container, component=child, in_message=fetch_saved_message_and_clear (child))
-                else:
-                    log_inout (container=container, component=child, in_message=msg)
-                destroy_message(msg)
-            else:
-                if (child.state != "idle"):
-                    msg = force_tick (container, child)
-                    child.handler(child, msg)
-                    log_tick (container=container, component=child, in_message=msg)
-                    destroy_message(msg)
-            
-            if (child.state == "active"):
-                # if child remains active, then the container must remain active and must propagate "ticks" to child
-                container.state = "active"
-            
-            while (not (child.outq.empty ())):
-                msg = child.outq.get ()
-                route(container, child, msg)
-                destroy_message(msg)
+    progress = False
+    for i in range (len (container.visit_ordering)):
+        child = container.visit_ordering.get ()
+        container.ready.discard (child)
+        if 0 < len (child.outq):
+            # outputs held back by a full queue (see set_inq_capacity) go first
+            if 0 < route_outputs (container, child):
+                progress = True
+        msg = None
+        ticked = False
+        if 0 < len (child.outq):
+            pass # still held
+        elif 0 < len (child.inq) and not (bounded_queues and child.kind == "container" and not (can_route (child, child, child.inq [0]))):
+            msg = child.inq.get ()
+            ticked = is_tick (msg)
+        elif (child.state != "idle"):
+            # (also a container whose next input would go down to a full queue - it is ticked, so that whatever
+            # is inside it gets on with draining that queue, and the input stays queued until there is room)
+            # ticked directly, not through child.inq, so that the tick isn't handled a second time on the next pass
+            msg = make_message (".", new_datum_tick ())
+            ticked = True
+        if msg != None:
+            [began_long_run, continued_long_run, ended_long_run] = step_child (child, msg)
+            if began_long_run:
+                save_message (child, msg)
+            elif continued_long_run:
+                pass
+            elif ended_long_run:
+                saved_msg = fetch_saved_message_and_clear (child)
+                if tracing:
+                    log_inout (container=container, component=child, in_message=saved_msg)
+            elif ticked:
+                log_tick (container=container, component=child, in_message=msg)
+            elif tracing:
+                log_inout (container=container, component=child, in_message=msg)
+            if not (ticked and continued_long_run):
+                progress = True
+            destroy_message(msg)
+        
+            if 0 < len (child.outq) and 0 < route_outputs (container, child):
+                progress = True
+
+        if (child.state == "active") or 0 < len (child.outq):
+            # if child remains active (or held), then the container must remain active and must propagate "ticks" to child
+            container.state = "active"
+
+        update_readiness (container, child)
+    return progress
 
 def attempt_tick (parent, eh):
     if eh.state != "idle":
-        force_tick (parent, eh)
+        # the child is ticked directly when its turn comes (see step_children), or handed the input that
+        # is waiting for it - a tick message on its inq would take up room in a bounded queue
+        schedule (parent, eh)
 
 def is_tick (msg):      
     return "tick" == msg.datum.kind ()
@@ -656,19 +857,16 @@ def route (container, from_component, message):
     was_sent = False # for checking that output went somewhere (at least during bootstrap)
     if is_tick (message):
         for child in container.children:    
-            attempt_tick (container, child, message)
+            attempt_tick (container, child)
         was_sent = True
     else:
+        for connector in container.routing_index.get ((from_component, message.port), ()):
+            deposit (container, connector, message)
+            was_sent = True
+    if not (was_sent): 
         fromname = ""
         if (not (is_self (from_component, container))):
             fromname = from_component.name
-        from_sender = Sender (name=fromname, component=from_component, port=message.port)
-        
-        for connector in container.connections:
-            if sender_eq (from_sender, connector.sender):   
-                deposit (container, connector, message)
-                was_sent = True
-    if not (was_sent): 
         output.append ("error","\n\n*** Error: ***")
         dump_possible_connections (container)
         output.print_routing_trace (container)
@@ -682,20 +880,36 @@ def dump_possible_connections (container):
     for connector in container.connections:
         output.append ("error",f"{connector.direction} ❲{connector.sender.name}❳.“{connector.sender.port}” -> ❲{connector.receiver.name}❳.“{connector.receiver.port}”")
 
+# Each container keeps a run queue (`visit_ordering`) of its children that have work to do,
+# and the set of children currently waiting in it (`ready`), which keeps the queue free of duplicates.
+# A child is queued when a message is pushed onto its input queue, or when it is left "active"
+# after being stepped, and it is dropped once it has been drained and is idle again. This replaces
+# a recursive walk of the whole subtree on every scheduling step - a child container always runs
+# its own children to quiescence (or goes "active") before returning, so its subtree never needs
+# to be polled from above.
+
 def any_child_ready (container):
-    for child in container.children:
-        if child_is_ready(child):
-            return True
-    return False
+    return 0 < len (container.ready)
 
-def child_is_ready (eh):      
-    return (not (eh.outq.empty ())) or (not (eh.inq.empty ())) or ( eh.state != "idle") or (any_child_ready (eh))
+def schedule (container, child):
+    # "self" (the container, as the receiver of up/through connections) is never stepped
+    if (not (is_self (child, container))) and (not (child in container.ready)):
+        container.ready.add (child)
+        container.visit_ordering.put (child)
+
+def update_readiness (container, child):
+    if (child.state != "idle") or (not (child.inq.empty ())) or (not (child.outq.empty ())):
+        schedule (container, child)
 
 def print_routing_trace (eh):
     output.append ("error",routing_trace_all (eh))
 
 def append_routing_descriptor (container, desc):
-    container.routings.put (desc)
+    if trace_level == traceFull:
+        container.routings.put (desc)
+    elif trace_level == traceSummary:
+        action = desc ["action"]
+        container.routing_counts [action] = container.routing_counts.get (action, 0) + 1
     
 ####
 def log_connection (container, connector, message):
@@ -718,7 +932,8 @@ def log_connection (container, connector, message):
         
 ####
 def container_injector (container, message):
-    log_inject (receiver=container, port=message.port, msg=message)
+    if tracing:
+        log_inject (receiver=container, port=message.port, msg=message)
     container_handler (container, message)
 
 class Component_Registry:
@@ -730,6 +945,7 @@ class Template:
         self.name = name
         self.template_data = template_data # used only for generate_shell_components (historical - needs to be rewritten)
         self.instantiator = instantiator
+        self.plan = None # Instantiation_Plan of a container template, see instantiation_plan
         
 def read_and_convert_json_file (filename):
     try:
@@ -819,11 +1035,17 @@ def generate_shell_components (reg, container_list):
             # loop through every component in the diagram and look for names that start with "$"
             # {'file': 'simple0d.drawio', 'name': 'main', 'children': [{'name': 'Echo', 'id': 5}], 'connections': [...]},
             for child_descriptor in diagram ['children']:
-                if first_char_is (child_descriptor ["name"], "$"):
+                if child_descriptor ["name"].startswith ("$$") or child_descriptor ["name"].startswith ("$#"):
+                    # "$$ cmd" and "$# cmd" keep cmd running as a co-process, see Coprocess
+                    name = child_descriptor ["name"]
+                    framing = "lines" if name [1] == "$" else "length"
+                    generated_leaf = Template (name=name, instantiator=coprocess_instantiate, template_data=[framing, name [2:].strip ()])
+                    register_component (reg, generated_leaf, ok_to_overwrite=True)
+                elif first_char_is (child_descriptor ["name"], "$"):
                     name = child_descriptor ["name"]
                     cmd = name [1:].strip ()
                     generated_leaf = Template (name=name, instantiator=shell_out_instantiate, template_data=cmd)
-                    register_component (reg, generated_leaf)
+                    register_component (reg, generated_leaf, ok_to_overwrite=True) # the same command can appear more than once
                 elif first_char_is (child_descriptor ["name"], "'"):
                     name = child_descriptor ["name"]
                     s = name [1:]
@@ -865,25 +1087,60 @@ def run_command (eh, cmd, s):
 
 
 
+# Single-threaded queues for the kernel.
+#
+# The kernel never blocks and never shares a queue between threads, so the
+# mutex and condition variable inside `queue.Queue` are pure overhead. These
+# keep the `put`/`get`/`empty`/`.queue` surface of `queue.Queue` so that
+# existing code (`list (eh.outq.queue)`, etc.) continues to work.
+
+class FIFO (collections.deque):
+    put = collections.deque.append
+    get = collections.deque.popleft
+    capacity = None # for input queues, see set_inq_capacity
+    high_water = 0 # the most messages that have waited in the queue at once, see queue_statistics
+    pending = () # messages that a blocking leaf has taken from the queue but not started on, and that count as waiting
+
+    def empty (self):
+        return 0 == len (self)
+
+    @property
+    def queue (self):
+        return self
+
+class LIFO (list):
+    put = list.append
+    get = list.pop
+
+    def empty (self):
+        return 0 == len (self)
+
+    @property
+    def queue (self):
+        return self
+
 # Eh_States :: enum { idle, active }
 
 class Eh:
     def __init__ (self):
         self.name = ""
-        self.inq = queue.Queue ()
-        self.outq = queue.Queue ()
+        self.inq = FIFO ()
+        self.outq = FIFO ()
         self.owner = None
-        self.saved_messages = queue.LifoQueue () ## stack of saved message(s)
+        self.saved_messages = LIFO () ## stack of saved message(s)
         self.inject = injector_NIY
         self.children = []
-        self.visit_ordering = queue.Queue ()
+        self.visit_ordering = FIFO () # run queue of children, see schedule
+        self.ready = set () # children currently waiting in visit_ordering
         self.connections = []
-        self.routings = queue.Queue ()
+        self.routing_index = {} # (sender component, sender port) -> [Connector], see make_routing_index
+        self.routings = FIFO (maxlen=trace_capacity) # ring buffer of routing descriptors, when trace_level is traceFull
+        self.routing_counts = {} # action -> count, when trace_level is traceSummary
         self.handler = None
         self.instance_data = None
         self.state = "idle"
         # bootstrap debugging
-        self.kind = None # enum { container, leaf, }
+        self.kind = None # enum { container, leaf, stand-in }
         self.trace = False # set 'True' if logging is enabled and if this component should be traced, (False means silence, no tracing for this component)
         self.depth = 0 # hierarchical depth of component, 0=top, 1=1st child of top, 2=1st child of 1st child of top, etc.
 
@@ -897,6 +1154,8 @@ def make_container (name, owner):
     eh.inject = container_injector
     eh.state = "idle"
     eh.kind = "container"
+    if default_inq_capacity != None:
+        set_inq_capacity (eh, default_inq_capacity)
     return eh
 
 
@@ -910,20 +1169,297 @@ def make_leaf (name, owner, instance_data, handler):
     eh.instance_data = instance_data
     eh.state = "idle"
     eh.kind = "leaf"
+    if default_inq_capacity != None:
+        set_inq_capacity (eh, default_inq_capacity)
+    return eh
+
+####
+# Bounded queues
+#
+# Input queues are unbounded unless given a capacity, with `set_inq_capacity`, or for every component made
+# after `default_inq_capacity` is set. A child's output is only routed when every queue that it goes to has
+# room. Otherwise the child is held: its outputs stay on its outq, and it is not stepped again (nor given
+# input, nor ticked) until they have all been delivered, while its container stays "active" so that it keeps
+# being visited. A producer that sends a piece at a time (e.g. Read File Lines) then runs no further ahead
+# of its slowest consumer than the consumer's capacity. Messages that come down from a container, or are
+# injected, are always delivered. An input to a sub-container is only taken off its inq when the queues that
+# it goes down to have room - until then the sub-container is ticked instead, so a slow consumer inside a
+# sub-container holds back the producers outside it. A cycle of full queues deadlocks - this is reported
+# as a runtime error by `check_for_deadlock`, rather than left spinning.
+# A sub-container's outq gets the same capacity as its inq, so that a child whose output goes up is held
+# inside the sub-container, and the sub-container is held by its owner while its outq can't be delivered
+# (see container_handler) - backpressure reaches producers at any depth. The top-level container's outq,
+# which collects the network's results, is never bounded.
+
+default_inq_capacity = None
+bounded_queues = False # set once any queue has a capacity (and cleared by reset_run_state), so that unbounded networks don't pay for the checks
+
+def set_inq_capacity (eh, capacity):
+    global bounded_queues
+    eh.inq.capacity = capacity
+    if eh.kind == "container" and eh.owner != None:
+        eh.outq.capacity = capacity
+    if capacity != None:
+        bounded_queues = True
+
+def is_full (q):
+    return q.capacity != None and len (q) + len (q.pending) >= q.capacity
+
+def can_route (container, from_component, message):
+    for connector in container.routing_index.get ((from_component, message.port), ()):
+        if is_full (connector.receiver.queue):
+            return False
+    return True
+
+# Routes the child's outputs, in order, until one can't be routed. Returns the number routed.
+def route_outputs (container, child):
+    outq = child.outq
+    if len (outq) > outq.high_water:
+        outq.high_water = len (outq)
+    routed = 0
+    while 0 < len (outq):
+        if bounded_queues and not (can_route (container, child, outq [0])):
+            break
+        msg = outq.get ()
+        route (container, child, msg)
+        destroy_message (msg)
+        routed += 1
+    return routed
+
+# True if a component under `eh` is held back by a full queue.
+def is_stalled (eh):
+    stack = list (eh.children)
+    while 0 < len (stack):
+        component = stack.pop ()
+        if 0 < len (component.outq):
+            return True
+        if component.kind == "container":
+            if 0 < len (component.inq) and not (can_route (component, component, component.inq [0])):
+                return True
+            stack.extend (component.children)
+    return False
+
+# Called by the top-level container when a pass has made no progress. With no blocking calls in flight,
+# nothing can change, so if a component is being held, the held components are waiting on each other.
+def check_for_deadlock (container):
+    if bounded_queues and 0 == len (blocking_calls) and is_stalled (container):
+        dump_queue_statistics (container)
+        runtime_error (f"{container.name}: deadlocked - components are held back by full queues that can't drain (queues above, see set_inq_capacity)")
+
+# Returns [component name, "inq" or "outq", messages waiting, high-water mark, capacity] for every queue in
+# the network under `eh`, in hierarchy order.
+def queue_statistics (eh):
+    stats = []
+    stack = [eh]
+    while 0 < len (stack):
+        component = stack.pop ()
+        for [which, q] in [["inq", component.inq], ["outq", component.outq]]:
+            stats.append ([component.name, which, len (q) + len (q.pending), q.high_water, q.capacity])
+        stack.extend (reversed (component.children))
+    return stats
+
+def dump_queue_statistics (eh):
+    for [name, which, waiting, high_water, capacity] in queue_statistics (eh):
+        output.append ("error", f"{name}.{which}: {waiting} waiting, high-water mark {high_water}, capacity {capacity if capacity != None else 'unbounded'}")
+
+####
+# Blocking leaves
+#
+# A leaf made with `make_blocking_leaf` runs its handler on a worker thread from `blocking_pool`, so that
+# blocking I/O (reading files, running commands) doesn't stall the rest of the network. While a call is
+# running, the leaf stays "active" and is polled by ticks, through the long-run machinery in `step_children`.
+# The handler sends to a stand-in component, whose outputs are handed on to the leaf when the call has
+# finished, so that routing stays on the kernel's thread. Messages that arrive during a call are handled
+# one call at a time, in arrival order.
+#
+# The handler may also be an `async def` coroutine function. When the network is run from a coroutine,
+# with `inject_async` (or `start_async`), coroutine handlers run as tasks on the caller's event loop, and
+# the kernel awaits them (and the thread pool) whenever it has nothing else to do, so that it can share an
+# event loop with e.g. the REPL's websocket servers. Under `inject` (or `start`), they run on a background
+# event loop thread.
+#
+# A leaf made with `make_process_leaf` runs its handler in a worker process from `process_pool` instead,
+# for CPU-bound handlers, so that they run on other cores. The handler must be a module-level function,
+# and its instance data must be picklable - it is shipped to the worker with each message, and the
+# worker's copy is shipped back with the outputs. String and bytes datums of `shared_memory_threshold`
+# bytes or more travel through shared memory rather than through the pool's pipes.
+
+blocking_pool_size = 8
+blocking_pool = None
+blocking_calls = set () # calls in flight, see wait_for_blocking_calls
+blocking_poll_interval = 0.01 # seconds, upper bound on a wait, so that other long-running components still get ticked
+process_pool_size = os.cpu_count ()
+process_pool = None
+shared_memory_threshold = 1 << 20
+kernel_loop = None # the event loop that inject_async is running on
+coroutine_loop = None # background event loop for coroutine handlers, when the kernel runs synchronously
+
+class Blocking_Leaf_Data:
+    def __init__ (self, stand_in, separate_process=False):
+        self.stand_in = stand_in # a leaf with the real handler and instance data
+        self.separate_process = separate_process
+        self.pending = FIFO ()
+        self.call = None # concurrent.futures.Future of the call in progress
+        self.cause = None # the message that the call in progress is handling
+
+def make_stand_in (name, owner, instance_data, handler):
+    stand_in = make_leaf (name, owner, instance_data, handler)
+    stand_in.kind = "stand-in"
+    return stand_in
+
+def make_blocking_leaf (name, owner, instance_data, handler):
+    stand_in = make_stand_in (name, owner, instance_data, handler)
+    eh = make_leaf (name, owner, Blocking_Leaf_Data (stand_in), blocking_leaf_handler)
+    eh.inq.pending = eh.instance_data.pending
     return eh
 
+def make_process_leaf (name, owner, instance_data, handler):
+    stand_in = make_stand_in (name, owner, instance_data, handler)
+    eh = make_leaf (name, owner, Blocking_Leaf_Data (stand_in, separate_process=True), blocking_leaf_handler)
+    eh.inq.pending = eh.instance_data.pending
+    return eh
+
+def blocking_leaf_handler (eh, msg):
+    inst = eh.instance_data
+    if not (is_tick (msg)):
+        inst.pending.put (msg)
+    if inst.call != None and inst.call.done ():
+        finish_blocking_call (eh, inst)
+    if inst.call == None and not (inst.pending.empty ()):
+        start_blocking_call (inst)
+    if inst.call == None:
+        set_idle (eh)
+    else:
+        set_active (eh)
+
+def start_blocking_call (inst):
+    global blocking_pool, process_pool
+    stand_in = inst.stand_in
+    msg = inst.pending.get ()
+    inst.cause = msg
+    if inst.separate_process:
+        if process_pool == None:
+            # spawned rather than forked, as the kernel process may already be running threads
+            process_pool = concurrent.futures.ProcessPoolExecutor (max_workers=process_pool_size, mp_context=multiprocessing.get_context ("spawn"))
+        inst.call = process_pool.submit (process_call, stand_in.handler, stand_in.name, stand_in.instance_data, msg.port, pack_datum (msg.datum))
+    elif inspect.iscoroutinefunction (stand_in.handler):
+        inst.call = start_coroutine (stand_in.handler (stand_in, msg))
+    else:
+        if blocking_pool == None:
+            blocking_pool = concurrent.futures.ThreadPoolExecutor (max_workers=blocking_pool_size, thread_name_prefix="0d-blocking")
+        inst.call = blocking_pool.submit (stand_in.handler, stand_in, msg)
+    blocking_calls.add (inst.call)
+
+def start_coroutine (coroutine):
+    global coroutine_loop
+    if kernel_loop != None:
+        return kernel_loop.create_task (coroutine)
+    if coroutine_loop == None:
+        coroutine_loop = asyncio.new_event_loop ()
+        threading.Thread (target=coroutine_loop.run_forever, name="0d-coroutines", daemon=True).start ()
+    return asyncio.run_coroutine_threadsafe (coroutine, coroutine_loop)
+
+def finish_blocking_call (eh, inst):
+    call = inst.call
+    inst.call = None
+    blocking_calls.discard (call)
+    result = call.result () # re-raises anything that the handler raised, on the kernel's thread
+    if inst.separate_process:
+        [inst.stand_in.instance_data, outputs] = result
+        for [port, packed] in outputs:
+            inst.stand_in.outq.put (make_message (port, unpack_datum (packed)))
+    while not (inst.stand_in.outq.empty ()):
+        msg = inst.stand_in.outq.get ()
+        if tracing:
+            log_send (sender=eh, sender_port=msg.port, msg=msg, cause_msg=inst.cause)
+        put_output (eh, msg)
+    inst.cause = None
+
+# Runs in a process_pool worker. Returns [the handler's instance data, [[port, packed datum], ...]].
+def process_call (handler, name, instance_data, port, packed):
+    global tracing
+    tracing = False # the worker has no containers to record routings in
+    eh = Eh ()
+    eh.name = name
+    eh.instance_data = instance_data
+    eh.kind = "leaf"
+    handler (eh, make_message (port, unpack_datum (packed)))
+    outputs = []
+    while not (eh.outq.empty ()):
+        msg = eh.outq.get ()
+        outputs.append ([msg.port, pack_datum (msg.datum)])
+    return [eh.instance_data, outputs]
+
+# Large string and bytes datums are copied into a shared memory block, which the receiving process
+# copies out of and unlinks. Everything else is pickled as it is.
+def pack_datum (datum):
+    kind = datum.kind ()
+    if kind == "string" or kind == "bytes":
+        data = datum.data.encode ('utf-8') if kind == "string" else datum.data
+        if len (data) >= shared_memory_threshold:
+            block = shared_memory.SharedMemory (create=True, size=len (data))
+            block.buf [:len (data)] = data
+            block.close ()
+            return ["shared", kind, block.name, len (data)]
+    return ["pickled", datum]
+
+def unpack_datum (packed):
+    if packed [0] == "pickled":
+        return packed [1]
+    [tag, kind, name, size] = packed
+    block = shared_memory.SharedMemory (name=name)
+    data = bytes (block.buf [:size])
+    block.close ()
+    block.unlink ()
+    if kind == "string":
+        return new_datum_string (data.decode ('utf-8'))
+    return new_datum_bytes (data)
+
+def wait_for_blocking_calls ():
+    if 0 < len (blocking_calls):
+        concurrent.futures.wait (list (blocking_calls), timeout=blocking_poll_interval, return_when=concurrent.futures.FIRST_COMPLETED)
+
+async def wait_for_blocking_calls_async ():
+    if 0 < len (blocking_calls):
+        await asyncio.wait ([asyncio.wrap_future (call) for call in blocking_calls], timeout=blocking_poll_interval, return_when=asyncio.FIRST_COMPLETED)
+    else:
+        await asyncio.sleep (0)
+
+# The asyncio counterpart of `container_handler`, for the top-level container. It yields to the event loop
+# after every pass, and awaits the calls in flight instead of sleeping on them.
+async def container_handler_async (container, message):
+    route (container=container, from_component=container, message=message)
+    while any_child_ready (container):
+        if step_children (container, message):
+            await asyncio.sleep (0)
+        else:
+            check_for_deadlock (container)
+            await wait_for_blocking_calls_async ()
+
+async def inject_async (eh, msg):
+    global kernel_loop
+    kernel_loop = asyncio.get_running_loop ()
+    try:
+        if tracing:
+            log_inject (receiver=eh, port=msg.port, msg=msg)
+        await container_handler_async (eh, msg)
+    finally:
+        kernel_loop = None
+
 # Sends a message on the given `port` with `data`, placing it on the output
 # of the given component.
 def send (eh,port,datum,causingMessage):      
     msg = make_message(port, datum)
-    log_send (sender=eh, sender_port=port, msg=msg, cause_msg=causingMessage)
+    if tracing:
+        log_send (sender=eh, sender_port=port, msg=msg, cause_msg=causingMessage)
     put_output (eh, msg)
 
 
 def send_string (eh, port, s, causingMessage):
     datum = new_datum_string (s)
     msg = make_message(port=port, datum=datum)
-    log_send_string (sender=eh, sender_port=port, msg=msg, cause_msg=causingMessage)
+    if tracing:
+        log_send_string (sender=eh, sender_port=port, msg=msg, cause_msg=causingMessage)
     put_output (eh, msg)
 
 
@@ -986,6 +1522,16 @@ def injector_NIY (eh, msg):
 root_project = ""
 root_0D = ""
 
+# Clears per-run global state, so that a long-lived process (see run_worker.py)
+# gives the same results on every run as a freshly started one.
+def reset_run_state ():
+    global counter, rand, load_errors, runtime_errors, bounded_queues
+    counter = 0
+    bounded_queues = (default_inq_capacity != None)
+    rand = 0
+    load_errors = False
+    runtime_errors = False
+
 def set_environment (rproject, r0D):
     global root_project
     global root_0D
@@ -1100,7 +1646,7 @@ def deracer_handler (eh, msg):
 
 def low_level_read_text_file_instantiate (reg, owner, name, template_data):      
     name_with_id = gensymbol ("Low Level Read Text File")
-    return make_leaf (name_with_id, owner, None, low_level_read_text_file_handler)
+    return make_blocking_leaf (name_with_id, owner, None, low_level_read_text_file_handler)
 
 
 def low_level_read_text_file_handler (eh, msg):      
@@ -1124,6 +1670,80 @@ def low_level_read_text_file_handler (eh, msg):
 
 
 
+####
+# "Read File Chunks" and "Read File Lines" stream a file. Given a filename on "", they send the file's
+# contents a piece at a time on "" - bytes datums of up to `file_chunk_size` bytes, or a string datum
+# for each line (newline included) - followed by a bang on "eof". The component stays "active" while
+# streaming, and sends the next piece each time it is ticked - one piece per step, which is as fast as
+# a downstream component takes them - so that downstream components start on the first piece while the
+# rest is still unread, and only about a chunk of the file is held in memory at a time (lines are read
+# a chunk's worth at a time). Filenames that arrive while a file is being streamed are streamed after it.
+# Errors go to "✗".
+
+file_chunk_size = 1 << 20
+
+class File_Stream_Data:
+    def __init__ (self, lines):
+        self.lines = lines
+        self.requests = FIFO () # filename messages not started yet
+        self.f = None
+        self.cause = None # the message that named the file being streamed
+        self.unsent_lines = FIFO ()
+
+def read_file_chunks_instantiate (reg, owner, name, template_data):
+    name_with_id = gensymbol ("Read File Chunks")
+    return make_leaf (name_with_id, owner, File_Stream_Data (False), file_stream_handler)
+
+def read_file_lines_instantiate (reg, owner, name, template_data):
+    name_with_id = gensymbol ("Read File Lines")
+    return make_leaf (name_with_id, owner, File_Stream_Data (True), file_stream_handler)
+
+def file_stream_handler (eh, msg):
+    inst = eh.instance_data
+    if not (is_tick (msg)):
+        inst.requests.put (msg)
+    while inst.f == None and not (inst.requests.empty ()):
+        inst.cause = inst.requests.get ()
+        fname = inst.cause.datum.srepr ()
+        try:
+            if inst.lines:
+                inst.f = open (fname, encoding='utf-8')
+            else:
+                inst.f = open (fname, 'rb')
+        except Exception as e:
+            send_string (eh, "✗", f"open error on file {fname}", inst.cause)
+    if inst.f != None:
+        send_file_piece (eh, inst)
+    if inst.f != None or not (inst.requests.empty ()):
+        set_active (eh)
+    else:
+        set_idle (eh)
+
+def send_file_piece (eh, inst):
+    try:
+        if not (inst.lines):
+            piece = inst.f.read (file_chunk_size)
+        elif inst.unsent_lines.empty ():
+            inst.unsent_lines.extend (inst.f.readlines (file_chunk_size))
+            piece = None if inst.unsent_lines.empty () else inst.unsent_lines.get ()
+        else:
+            piece = inst.unsent_lines.get ()
+    except Exception as e:
+        send_string (eh, "✗", f"read error on file {inst.f.name}: {e}", inst.cause)
+        inst.unsent_lines.clear ()
+        piece = False
+    if piece:
+        if inst.lines:
+            send_string (eh, "", piece, inst.cause)
+        else:
+            send (eh, "", new_datum_bytes (piece), inst.cause)
+    else:
+        inst.f.close ()
+        inst.f = None
+        if piece != False:
+            send_bang (eh, "eof", inst.cause)
+
+
 ####
 def ensure_string_datum_instantiate (reg, owner, name, template_data):      
     name_with_id = gensymbol ("Ensure String Datum")
@@ -1150,7 +1770,7 @@ class Syncfilewrite_Data:
 def syncfilewrite_instantiate (reg, owner, name, template_data):      
     name_with_id = gensymbol ("syncfilewrite")
     inst = Syncfilewrite_Data ()
-    return make_leaf (name_with_id, owner, inst, syncfilewrite_handler)
+    return make_blocking_leaf (name_with_id, owner, inst, syncfilewrite_handler)
 
 
 def syncfilewrite_handler (eh, msg):      
@@ -1167,6 +1787,99 @@ def syncfilewrite_handler (eh, msg):
         else:
             send_string (eh, "✗", f"open error on file {inst.filename}", msg)
 
+####
+# "Buffered File Writer" appends records to a file a batch at a time. A message on "filename" names the
+# file, which is opened for appending (after the previous one is written out and closed), and each
+# "input" datum - a string, or bytes - is added to the buffer as it is, with no separator. The buffer is
+# written out with one write when it holds `file_writer_flush_bytes` bytes or `file_writer_flush_count`
+# records, or when a record arrives `file_writer_flush_interval` seconds or more after the oldest one
+# waiting. A message on "flush" writes the buffer out now, and one on "close" writes it out and closes
+# the file - both are answered with a bang on "done". Whatever is still buffered when a run ends is
+# written out by `flush_file_writers`. Errors go to "✗".
+
+file_writer_flush_bytes = 1 << 16
+file_writer_flush_count = 1024
+file_writer_flush_interval = 1.0 # seconds
+unflushed_file_writers = set () # File_Writer_Data that hold buffered records, see flush_file_writers
+
+class File_Writer_Data:
+    def __init__ (self):
+        self.f = None
+        self.records = []
+        self.size = 0
+        self.oldest = None # time.monotonic () when the oldest buffered record arrived
+
+def buffered_file_writer_instantiate (reg, owner, name, template_data):
+    name_with_id = gensymbol ("Buffered File Writer")
+    return make_leaf (name_with_id, owner, File_Writer_Data (), buffered_file_writer_handler)
+
+def buffered_file_writer_handler (eh, msg):
+    inst = eh.instance_data
+    if "filename" == msg.port:
+        report_file_writer_error (eh, close_file_writer (inst), msg)
+        fname = msg.datum.srepr ()
+        try:
+            inst.f = open (fname, "ab", buffering=0) # the records are batched here, rather than by the file
+        except Exception as e:
+            send_string (eh, "✗", f"open error on file {fname}", msg)
+    elif "input" == msg.port:
+        if inst.f == None:
+            send_string (eh, "✗", "Buffered File Writer: input before filename", msg)
+            return
+        record = msg.datum.raw () if "bytes" == msg.datum.kind () else msg.datum.srepr ().encode ('utf-8')
+        now = time.monotonic ()
+        if inst.oldest == None:
+            inst.oldest = now
+            unflushed_file_writers.add (inst)
+        inst.records.append (record)
+        inst.size += len (record)
+        if (inst.size >= file_writer_flush_bytes or len (inst.records) >= file_writer_flush_count
+            or now - inst.oldest >= file_writer_flush_interval):
+            report_file_writer_error (eh, flush_file_writer (inst), msg)
+    elif "flush" == msg.port:
+        if not (report_file_writer_error (eh, flush_file_writer (inst), msg)):
+            send_bang (eh, "done", msg)
+    elif "close" == msg.port:
+        if not (report_file_writer_error (eh, close_file_writer (inst), msg)):
+            send_bang (eh, "done", msg)
+    else:
+        send_string (eh, "✗", f"Buffered File Writer: bad port {msg.port}", msg)
+
+def report_file_writer_error (eh, err, msg):
+    if err != None:
+        send_string (eh, "✗", err, msg)
+    return err != None
+
+# These return None, or an error message.
+def flush_file_writer (inst):
+    unflushed_file_writers.discard (inst)
+    records = inst.records
+    inst.records = []
+    inst.size = 0
+    inst.oldest = None
+    if 0 < len (records) and inst.f != None:
+        try:
+            inst.f.write (b"".join (records))
+        except Exception as e:
+            return f"write error on file {inst.f.name}: {e}"
+    return None
+
+def close_file_writer (inst):
+    err = flush_file_writer (inst)
+    if inst.f != None:
+        inst.f.close ()
+        inst.f = None
+    return err
+
+# Writes out the records that are still buffered, e.g. at the end of a run.
+def flush_file_writers ():
+    for inst in list (unflushed_file_writers):
+        err = flush_file_writer (inst)
+        if err != None:
+            output.append ("error", err)
+
+atexit.register (flush_file_writers)
+
 ####
 
 class StringConcat_Instance_Data:
@@ -1219,7 +1932,7 @@ def maybe_stringconcat (eh, inst, msg):
 def shell_out_instantiate (reg, owner, name, template_data):
     name_with_id = gensymbol ("shell_out")
     cmd = shlex.split (template_data)
-    return make_leaf (name_with_id, owner, cmd, shell_out_handler)
+    return make_blocking_leaf (name_with_id, owner, cmd, shell_out_handler)
 
 def shell_out_handler (eh, msg):
     cmd = eh.instance_data
@@ -1230,6 +1943,194 @@ def shell_out_handler (eh, msg):
     else:
         send_string (eh, "", stdout, msg)
 
+####
+# Co-processes
+#
+# "$ cmd" starts cmd afresh for every message. "$$ cmd" and "$# cmd" instead keep up to
+# `coprocess_pool_size` copies of cmd running (shared by every component with the same command),
+# and exchange each message with one of them over its stdin and stdout:
+#
+#   "$$" - line framing: the message (with a newline added if it doesn't end with one) is written as is,
+#          and the reply is the same number of lines. This suits filters like `sed -u` or `jq -c --unbuffered`,
+#          which must not buffer their output.
+#   "$#" - length framing: the message is written as "<byte count>\n<bytes>", and the reply is read back
+#          in the same form. For programs written to be 0D co-processes.
+#
+# A co-process that has exited, or that takes longer than `coprocess_timeout` seconds to reply, is killed
+# and the message is answered on "✗" - the next message starts a fresh copy.
+
+coprocess_pool_size = 4
+coprocess_timeout = 30.0
+coprocess_pools = {} # [framing, command] -> Coprocess_Pool
+coprocess_pools_lock = threading.Lock () # co-process leaves are blocking leaves, so they run on several threads
+
+class Coprocess_Error (Exception):
+    pass
+
+class Coprocess:
+    def __init__ (self, cmd, framing):
+        self.framing = framing
+        self.stderr = tempfile.TemporaryFile ()
+        self.process = subprocess.Popen (cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.stderr)
+        os.set_blocking (self.process.stdin.fileno (), False)
+        self.buffer = bytearray ()
+
+    def is_alive (self):
+        return self.process.poll () == None
+
+    def kill (self):
+        if self.is_alive ():
+            self.process.kill ()
+        self.process.wait ()
+        self.process.stdin.close ()
+        self.process.stdout.close ()
+        self.stderr.close ()
+
+    # Returns the reply to `s`, or raises Coprocess_Error.
+    def exchange (self, s):
+        data = s.encode ('utf-8')
+        if self.framing == "lines":
+            if not data.endswith (b"\n"):
+                data += b"\n"
+            lines = data.count (b"\n")
+            request = data
+        else:
+            request = f"{len (data)}\n".encode ('ascii') + data
+        deadline = time.monotonic () + coprocess_timeout
+        stdin = self.process.stdin.fileno ()
+        stdout = self.process.stdout.fileno ()
+        # the request is written while the reply is read, so that a large message can't deadlock with a child
+        # that is blocked on writing its reply
+        written = 0
+        while True:
+            if self.framing == "lines":
+                end = self.line_reply_end (lines)
+            else:
+                end = self.length_reply_end ()
+            if end != None:
+                reply = bytes (self.buffer [:end])
+                del self.buffer [:end]
+                if self.framing == "length":
+                    reply = reply [reply.index (b"\n") + 1:]
+                return reply.decode ('utf-8')
+            remaining = deadline - time.monotonic ()
+            if remaining <= 0:
+                raise Coprocess_Error (f"co-process {self.process.args} timed out after {coprocess_timeout}s")
+            writers = [stdin] if written < len (request) else []
+            [readable, writable, errors] = select.select ([stdout], writers, [], remaining)
+            if 0 < len (writable):
+                try:
+                    written += os.write (stdin, request [written:written + 65536])
+                except BrokenPipeError:
+                    raise Coprocess_Error (self.exit_message ())
+            if 0 < len (readable):
+                chunk = os.read (stdout, 65536)
+                if 0 == len (chunk):
+                    raise Coprocess_Error (self.exit_message ())
+                self.buffer += chunk
+
+    def line_reply_end (self, lines):
+        end = 0
+        for i in range (lines):
+            end = self.buffer.find (b"\n", end) + 1
+            if end == 0:
+                return None
+        return end
+
+    def length_reply_end (self):
+        header_end = self.buffer.find (b"\n")
+        header = bytes (self.buffer [:header_end if 0 <= header_end else len (self.buffer)])
+        if not (header.isdigit () or (header_end < 0 and header == b"")):
+            # anything but a byte count means that the child wrote something unframed, and the stream is lost
+            raise Coprocess_Error (f"co-process {self.process.args} wrote an unframed reply: {header [:80].decode ('utf-8', errors='replace')!r}")
+        if header_end < 0:
+            return None
+        end = header_end + 1 + int (header)
+        if len (self.buffer) < end:
+            return None
+        return end
+
+    def exit_message (self):
+        self.process.wait ()
+        self.stderr.seek (0)
+        err = self.stderr.read ().decode ('utf-8', errors='replace')
+        return err if 0 < len (trimws (err)) else f"co-process {self.process.args} exited with code {self.process.returncode}"
+
+class Coprocess_Pool:
+    def __init__ (self, cmd, framing):
+        self.cmd = cmd
+        self.framing = framing
+        self.idle = []
+        self.running = 0
+        self.available = threading.Condition ()
+
+    def acquire (self):
+        with self.available:
+            while True:
+                while 0 < len (self.idle):
+                    coprocess = self.idle.pop ()
+                    if coprocess.is_alive ():
+                        return coprocess
+                    # exited while idle, start another one
+                    coprocess.kill ()
+                    self.running -= 1
+                if self.running < coprocess_pool_size:
+                    self.running += 1
+                    break
+                self.available.wait ()
+        try:
+            return Coprocess (self.cmd, self.framing)
+        except OSError:
+            self.release (None, False)
+            raise
+
+    def release (self, coprocess, ok):
+        with self.available:
+            if ok:
+                self.idle.append (coprocess)
+            else:
+                if coprocess != None:
+                    coprocess.kill ()
+                self.running -= 1
+            self.available.notify ()
+
+    # Returns [reply, None] or [None, error message].
+    def exchange (self, s):
+        try:
+            coprocess = self.acquire ()
+        except OSError as e:
+            return [None, f"can't start co-process {self.cmd}: {e}"]
+        # the co-process is handed back whatever happens, and only kept if the exchange went through
+        ok = False
+        try:
+            reply = coprocess.exchange (s)
+            ok = True
+        except (Coprocess_Error, UnicodeDecodeError) as e:
+            return [None, str (e)]
+        finally:
+            self.release (coprocess, ok)
+        return [reply, None]
+
+def get_coprocess_pool (framing, command):
+    with coprocess_pools_lock:
+        key = (framing, command)
+        if not (key in coprocess_pools):
+            coprocess_pools [key] = Coprocess_Pool (shlex.split (command), framing)
+        return coprocess_pools [key]
+
+def coprocess_instantiate (reg, owner, name, template_data):
+    name_with_id = gensymbol ("coprocess")
+    [framing, command] = template_data
+    return make_blocking_leaf (name_with_id, owner, get_coprocess_pool (framing, command), coprocess_handler)
+
+def coprocess_handler (eh, msg):
+    pool = eh.instance_data
+    [reply, err] = pool.exchange (msg.datum.srepr ())
+    if err != None:
+        send_string (eh, "✗", err, msg)
+    else:
+        send_string (eh, "", reply, msg)
+
 ####
 
 def string_constant_instantiate (reg, owner, name, template_data):
@@ -1282,6 +2183,28 @@ def initialize_component_palette (root_project, root_0D, diagram_source_files):
     initialize_stock_components (reg)
     return reg
 
+# Brings an existing palette up to date with a newly transpiled diagram file: only the
+# container templates whose descriptors changed are replaced (along with the shell and
+# string-constant components they use), templates of tabs that no longer exist are dropped,
+# and every other template - including the stock components - is kept as it is.
+# Returns the number of container templates that were replaced or added.
+def update_component_palette (reg, container_list):
+    replaced = 0
+    names = set ()
+    for container in container_list:
+        name = mangle_name (container ['name'])
+        names.add (name)
+        old = reg.templates.get (name)
+        if old == None or old.template_data != container:
+            generate_shell_components (reg, [container])
+            register_component (reg, Template (name=container ['name'], template_data=container, instantiator=container_instantiator), ok_to_overwrite=True)
+            replaced += 1
+    for name in list (reg.templates):
+        template = reg.templates [name]
+        if template.instantiator == container_instantiator and not (name in names):
+            del reg.templates [name]
+    return replaced
+
 
 def print_error_maybe (main_container):
     error_port = "✗"
@@ -1365,12 +2288,25 @@ class OhmJS_Instance_Data:
 def ohmjs_instantiate (reg, owner, name, template_data):
     instance_name = gensymbol ("OhmJS")
     inst = OhmJS_Instance_Data () # all fields have zero value before any messages are received
-    return make_leaf (instance_name, owner, inst, ohmjs_handle)
+    return make_blocking_leaf (instance_name, owner, inst, ohmjs_handle)
+
+# When `ohmjs_persistent` is set, inputs are parsed by a long-lived ohmjs_server.js co-process (see Coprocess),
+# instead of by a fresh node running <0D>/std/ohmjs.js each time. The server runs ohmjs.js's own code for each
+# input, with the same arguments, input and captured output, and keeps ohm-js and compiled grammars between
+# inputs. When ohmjs.js can't be run that way (e.g. it is an ES module), it is run on its own, as before.
+ohmjs_persistent = True
+ohmjs_server_script = os.path.join (os.path.dirname (os.path.abspath (__file__)), "ohmjs_server.js")
 
 def ohmjs_maybe (eh, inst, causingMsg):
     if None != inst.pathname_0D_ and None != inst.grammar_name and None != inst.grammar_filename and None != inst.semantics_filename and None != inst.s:
-        cmd = [f"{inst.pathname_0D_}/std/ohmjs.js", f"{inst.grammar_name}", f"{inst.grammar_filename}", f"{inst.semantics_filename}"]
-        [captured_output, err] = run_command (eh, cmd, inst.s)
+        reply = None
+        if ohmjs_persistent:
+            reply = ohmjs_server_parse (inst)
+        if reply != None:
+            [captured_output, err] = reply
+        else:
+            cmd = [f"{inst.pathname_0D_}/std/ohmjs.js", f"{inst.grammar_name}", f"{inst.grammar_filename}", f"{inst.semantics_filename}"]
+            [captured_output, err] = run_command (eh, cmd, inst.s)
 
         if err == None:
             err = ""
@@ -1385,6 +2321,23 @@ def ohmjs_maybe (eh, inst, causingMsg):
         inst.semantics_filename = None
         inst.s = None
 
+# Returns [output, error] as run_command does for ohmjs.js, or None if ohmjs.js has to be run on its own.
+def ohmjs_server_parse (inst):
+    pool = get_coprocess_pool ("length", f"node {shlex.quote (ohmjs_server_script)}")
+    request = {"cwd": os.getcwd (), "zd": inst.pathname_0D_, "grammar_name": inst.grammar_name, "grammar": inst.grammar_filename,
+               "semantics": inst.semantics_filename, "input": inst.s}
+    [reply, err] = pool.exchange (json.dumps (request))
+    if err != None:
+        return ["", err]
+    reply = json.loads (reply)
+    if not reply ["ok"]:
+        return None
+    elif reply ["code"] != 0:
+        if reply ["stderr"] != "":
+            return ["", reply ["stderr"]]
+        return ["", f"error in shell_out {reply ['code']}"]
+    return [reply ["stdout"], None]
+
 def ohmjs_handle (eh, msg):
     inst = eh.instance_data
     if msg.port == "0D path":
@@ -1420,9 +2373,12 @@ def initialize_stock_components (reg):
     register_component (reg, Template ( name = "trash", instantiator = trash_instantiate))
 
     register_component (reg, Template ( name = "Low Level Read Text File", instantiator = low_level_read_text_file_instantiate))
+    register_component (reg, Template ( name = "Read File Chunks", instantiator = read_file_chunks_instantiate))
+    register_component (reg, Template ( name = "Read File Lines", instantiator = read_file_lines_instantiate))
     register_component (reg, Template ( name = "Ensure String Datum", instantiator = ensure_string_datum_instantiate))
 
     register_component (reg, Template ( name = "syncfilewrite", instantiator = syncfilewrite_instantiate))
+    register_component (reg, Template ( name = "Buffered File Writer", instantiator = buffered_file_writer_instantiate))
     register_component (reg, Template ( name = "stringconcat", instantiator = stringconcat_instantiate))
     # for fakepipe
     register_component (reg, Template ( name = "fakepipename", instantiator = fakepipename_instantiate))
@@ -1442,35 +2398,62 @@ def initialize ():
     palette = initialize_component_palette (root_project, root_0D, diagram_names)
     return [palette, [root_of_project, root_of_0D, main_container_name, diagram_names, arg]]
 
-def start (palette, env, show_hierarchy=False, show_connections=False, show_traces=False, show_all_outputs=False):
+# `trace_level` defaults to traceFull when `show_traces` is set, and to traceOff otherwise.
+# When tracing, the routing trace is streamed to `trace_stream` (instead of the "output" buffer)
+# if one is given, and exported as JSON Lines to `trace_jsonl_stream` if one is given.
+# When `lazy` is set, sub-containers are instantiated on their first message (see `lazy_containers`).
+# `start_async` is the same, for running the network from a coroutine (see `inject_async`).
+def start (palette, env, show_hierarchy=False, show_connections=False, show_traces=False, show_all_outputs=False, trace_level=None, trace_capacity=None, trace_stream=None, trace_jsonl_stream=None, lazy=False):
+    main_container = load_main_container (palette, env, show_hierarchy, show_connections, show_traces, trace_level, trace_capacity, lazy)
+    if not load_errors:
+        inject (main_container, make_message ("", new_datum_string (env [4])))
+        flush_file_writers ()
+        report_outputs (main_container, show_all_outputs, trace_stream, trace_jsonl_stream)
+
+async def start_async (palette, env, show_hierarchy=False, show_connections=False, show_traces=False, show_all_outputs=False, trace_level=None, trace_capacity=None, trace_stream=None, trace_jsonl_stream=None, lazy=False):
+    main_container = load_main_container (palette, env, show_hierarchy, show_connections, show_traces, trace_level, trace_capacity, lazy)
+    if not load_errors:
+        await inject_async (main_container, make_message ("", new_datum_string (env [4])))
+        flush_file_writers ()
+        report_outputs (main_container, show_all_outputs, trace_stream, trace_jsonl_stream)
+
+def load_main_container (palette, env, show_hierarchy, show_connections, show_traces, trace_level, trace_capacity, lazy):
+    global lazy_containers
     root_of_project = env [0]
     root_of_0D = env [1]
     main_container_name = env [2]
     diagram_names = env [3]
-    arg = env [4]
     set_environment (root_of_project, root_of_0D)
+    if trace_level == None:
+        trace_level = traceFull if show_traces else traceOff
+    set_trace_level (trace_level, trace_capacity)
+    lazy_containers = lazy
     # get entrypoint container
     main_container = get_component_instance(palette, main_container_name, owner=None)
     if None == main_container:
-        load_error (f"Couldn't find container with page name {main_container_name} in files {diagram_source_files} (check tab names, or disable compression?)")
+        load_error (f"Couldn't find container with page name {main_container_name} in files {diagram_source_files} (check tab names?)")
     if show_hierarchy:
         dump_hierarchy (main_container)
     if show_connections:
         dump_connections (main_container)
-    if not load_errors:
-        arg = new_datum_string (arg)
-        msg = make_message("", arg)
-        inject (main_container, msg)
-        if show_all_outputs:
-            dump_outputs (main_container)
-        else:
-            print_error_maybe (main_container)
-            print_specific_output (main_container, port="", stderr=False)
-            if show_traces:
+    return main_container
+
+def report_outputs (main_container, show_all_outputs, trace_stream, trace_jsonl_stream):
+    if show_all_outputs:
+        dump_outputs (main_container)
+    else:
+        print_error_maybe (main_container)
+        print_specific_output (main_container, port="", stderr=False)
+        if trace_level != traceOff:
+            if trace_stream != None:
+                write_routing_trace (main_container, trace_stream)
+            else:
                 output.append ("output",  "--- routing traces ---")
                 output.append ("output",  routing_trace_all (main_container))
-        if show_all_outputs:
-            output.append ("output",  "--- done ---")
+            if trace_jsonl_stream != None:
+                export_routing_trace_jsonl (main_container, trace_jsonl_stream)
+    if show_all_outputs:
+        output.append ("output",  "--- done ---")
 
 
 
@@ -13,7 +13,8 @@ import websockets
 import json
 import os
 import time
-from compile_and_run import compile_and_run
+from compile_and_run import compile_and_run_async
+import run
 
 # Global variables
 file_being_watched = "test.drawio"
@@ -60,7 +61,7 @@ async def gui():
             # Check if input exists and ends with newline
             if input_from_gui and haskey(input_from_gui, 'input') and input_from_gui ['input'].endswith('\n'):
                 # Run compiler with input from GUI
-                result = compile_and_run(
+                result = await compile_and_run_async(
                     file_being_watched,
                     input_from_gui ['input'] if haskey(input_from_gui, 'input') else ""
                 )
@@ -89,9 +90,10 @@ async def file_watcher():
                 last_mod_time = current_mod_time
                 
                 # Run compiler with current GUI input if it exists
-                result = compile_and_run(
+                result = await compile_and_run_async(
                     file_being_watched,
-                    input_from_gui ['input'] if input_from_gui and haskey(input_from_gui, 'input') else ""
+                    input_from_gui ['input'] if input_from_gui and haskey(input_from_gui, 'input') else "",
+                    on_save=True
                 )
                 
                 # Send result to GUI
@@ -104,6 +106,9 @@ async def file_watcher():
             await asyncio.sleep(0.02)  # Continue checking even if there's an error
 
 async def repl():
+    # Warm up the diagram runners before the first edit arrives
+    run.start_workers ()
+
     # Start the websocket servers
     async with \
         websockets.serve(handle_to_gui, "localhost", 8765), \
@@ -1,15 +1,114 @@
 import subprocess
+import collections
+import json
+import asyncio
 import output
+import subprocess_run
+
+# Diagrams are run in long-lived worker processes (run_worker.py), so that a run does not pay for
+# interpreter start-up and imports. `pool_size` idle workers are kept warm. A worker is retired
+# after `max_runs_per_worker` runs, or as soon as a run crashes or aborts, and a fresh one is
+# started in its place while the REPL is idle.
+
+pool_size = 2
+max_runs_per_worker = 100
+
+# `run_async` runs the diagram on the caller's event loop when `in_process` is set, instead of in a
+# worker. This saves the round trip, but a diagram that aborts takes the REPL down with it.
+in_process = False
+run_lock = None # runs (and compiles) share output's (and in process, the kernel's) globals, so only one at a time
+
+def get_run_lock ():
+    global run_lock
+    if run_lock == None:
+        run_lock = asyncio.Lock ()
+    return run_lock
+
+class Worker:
+    def __init__ (self):
+        self.process = subprocess.Popen (['python3', 'run_worker.py'], stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding='utf-8')
+        self.runs = 0
+        self.failed = False
+
+    def request (self, filename, input_text):
+        # returns the worker's reply, or None if the worker died
+        self.runs += 1
+        try:
+            self.process.stdin.write (json.dumps ({"filename": filename, "input": input_text}) + "\n")
+            self.process.stdin.flush ()
+            line = self.process.stdout.readline ()
+        except BrokenPipeError:
+            line = ""
+        if line == "":
+            self.failed = True
+            self.process.wait ()
+            return None
+        try:
+            reply = json.loads (line)
+        except ValueError:
+            # something other than a reply got into the reply pipe, so the worker can't be trusted any more
+            self.failed = True
+            self.process.kill ()
+            self.process.wait ()
+            return None
+        if not reply ["ok"]:
+            self.failed = True # the worker exits after an aborted run
+        return reply
+
+    def is_reusable (self):
+        return (not self.failed) and (self.process.poll () == None) and (self.runs < max_runs_per_worker)
+
+    def retire (self):
+        if self.process.poll () == None:
+            self.process.stdin.close () # the worker exits when its input closes
+        
+idle_workers = collections.deque ()
+
+def start_workers ():
+    while len (idle_workers) < pool_size:
+        idle_workers.append (Worker ())
+
+def get_worker ():
+    # skips workers that died while idle
+    start_workers ()
+    worker = idle_workers.popleft ()
+    while worker.process.poll () != None:
+        start_workers ()
+        worker = idle_workers.popleft ()
+    return worker
+
+def release_worker (worker):
+    if worker.is_reusable ():
+        idle_workers.appendleft (worker)
+    else:
+        worker.retire ()
+    start_workers ()
 
 def run (filename, input_text):
     output.reset ()
     print (f'running diagram {filename} with input "{input_text}"')
-    ret = subprocess.run (['python3', 'subprocess_run.py', f'{filename}', f'{input_text}'], capture_output=True, encoding='utf-8')
-    if  not (ret.returncode == 0):
-        if ret.stderr != None:
-            output.append ("error", ret.stderr)
-        else:
-            output.append ("error", f"error in shell_out {ret.returncode}")
+    worker = get_worker ()
+    reply = worker.request (filename, input_text)
+    if reply == None:
+        output.append ("error", f"runner process exited with code {worker.process.poll ()}")
+    elif reply ["ok"]:
+        output.append ("output", reply ["result"])
     else:
-        output.append ("output", ret.stdout)
+        output.append ("error", reply ["error"])
+    release_worker (worker)
+    return output.get ()
+
+async def run_async (filename, input_text):
+    async with get_run_lock ():
+        return await run_async_locked (filename, input_text)
+
+# the same, for callers that already hold the run lock
+async def run_async_locked (filename, input_text):
+    if not in_process:
+        # waiting on a worker blocks, so it is done off the event loop
+        return await asyncio.to_thread (run, filename, input_text)
+    print (f'running diagram {filename} with input "{input_text}" in process')
+    result = await subprocess_run.run_async (filename, input_text)
+    output.reset ()
+    output.append ("output", result)
     return output.get ()
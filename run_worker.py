@@ -0,0 +1,40 @@
+# Long-lived diagram runner, driven by run.py.
+#
+# Reads one JSON request per line on stdin: {"filename": ..., "input": ...}
+# and writes one JSON reply per line on stdout:
+#   {"ok": true, "result": ...JSON string from subprocess_run.run...}
+#   {"ok": false, "error": ...error text...}
+# Anything else printed while running goes to stderr, so that stdout carries only replies: the replies
+# are written to a private copy of file descriptor 1, and descriptor 1 itself is pointed at stderr, so
+# that child processes (shell-outs, process-pool workers) that inherit it can't write into the replies.
+#
+# The kernel reports fatal errors by calling quit () / exit (). When that happens the
+# worker replies with the errors collected so far and then exits, and run.py replaces it.
+
+import sys
+import os
+import json
+
+import output
+import subprocess_run
+
+def serve ():
+    sys.stdout.flush ()
+    replies = os.fdopen (os.dup (1), "w", encoding="utf-8")
+    os.dup2 (2, 1)
+    sys.stdout = sys.stderr
+    for line in sys.stdin:
+        request = json.loads (line)
+        aborted = False
+        try:
+            reply = {"ok": True, "result": subprocess_run.run (request ["filename"], request ["input"])}
+        except (Exception, SystemExit) as e:
+            aborted = True
+            reply = {"ok": False, "error": output.get ().get ("error", f"run aborted: {e!r}")}
+        replies.write (json.dumps (reply) + "\n")
+        replies.flush ()
+        if aborted:
+            return
+
+if __name__ == "__main__":
+    serve ()
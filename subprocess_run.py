@@ -5,20 +5,54 @@ import json
 import sys
 
 import echo
+import diagram_cache
+
+palette = None
+
+# when set, sub-containers are instantiated on their first message (see py0dws.lazy_containers) - runs that
+# only exercise part of a big diagram start faster, but a bad component name in a sub-container is only
+# reported when the sub-container is reached, part way through the run
+lazy = False
+
+def build_palette (json_filename, data):
+    # the first palette is built from scratch, later ones only replace the containers (tabs) that changed
+    global palette
+    if palette == None:
+        palette = zd.initialize_component_palette ('.', '.', [json_filename])
+        echo.install (palette)
+    else:
+        zd.update_component_palette (palette, json.loads (data))
+    return palette
+
+# the palette is only updated when the transpiled diagram changes (matters when running in a long-lived run_worker.py)
+# - it is updated in place, so only the palette for the latest contents can be cached
+palettes = diagram_cache.Content_Cache (build_palette, max_entries=1)
 
 def initialize_hard_coded_test (arg):
-    palette = zd.initialize_component_palette ('.', '.', ['test.drawio.json'])
+    palette = palettes.get ('test.drawio.json')
     return [palette, ['.', '.', 'main', ['test.drawio.json'], arg]]
 
 def interpretDiagram (arg):
     [palette, env] = initialize_hard_coded_test (arg)
-    echo.install (palette)
-    zd.start (palette, env)
+    zd.start (palette, env, lazy=lazy)
+    return output.get ()
+
+async def interpretDiagram_async (arg):
+    [palette, env] = initialize_hard_coded_test (arg)
+    await zd.start_async (palette, env, lazy=lazy)
     return output.get ()
 
 def run (filename, input_text):
     output.reset ()
+    zd.reset_run_state ()
     # must return dictionary containing outputs {output: ...string..., error:...string...}, i.e. JSON
     return json.dumps (interpretDiagram (input_text))
 
-print (run (sys.argv [1], sys.argv [2]))
+# the same, run on the caller's event loop
+async def run_async (filename, input_text):
+    output.reset ()
+    zd.reset_run_state ()
+    return json.dumps (await interpretDiagram_async (input_text))
+
+if __name__ == "__main__":
+    print (run (sys.argv [1], sys.argv [2]))